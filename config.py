@@ -4,10 +4,20 @@ GitLab Token Monitor Configuration
 Handles environment variables and configuration settings
 """
 
+import logging
 import os
 import sys
+from functools import lru_cache
 from typing import Dict, List
 
+log = logging.getLogger(__name__)
+
+_BOOL = {'true': True, 'false': False, '1': True, '0': False}
+
+def _env_bool(name: str, default: str) -> bool:
+    """Read a boolean environment variable; unrecognised values are False"""
+    return _BOOL.get(os.getenv(name, default).lower(), False)
+
 class Config:
     def __init__(self):
         self.gitlab_url = os.getenv('GITLAB_URL', 'https://your-gitlab.com')
@@ -21,42 +31,55 @@ class Config:
             'to_emails': os.getenv('TO_EMAILS', 'admin@yourcompany.com').split(','),
             'username': os.getenv('SMTP_USERNAME'),
             'password': os.getenv('SMTP_PASSWORD'),
-            'use_ssl': os.getenv('SMTP_USE_SSL', 'true').lower() == 'true',
-            'use_tls': os.getenv('SMTP_USE_TLS', 'false').lower() == 'true'
+            'use_ssl': _env_bool('SMTP_USE_SSL', 'true'),
+            'use_tls': _env_bool('SMTP_USE_TLS', 'false')
         }
         
         # Monitoring Configuration
         self.days_threshold = int(os.getenv('DAYS_THRESHOLD', '7'))
-        self.include_project_tokens = os.getenv('INCLUDE_PROJECT_TOKENS', 'true').lower() == 'true'
-        self.include_group_tokens = os.getenv('INCLUDE_GROUP_TOKENS', 'true').lower() == 'true'
-        self.send_all_tokens = os.getenv('SEND_ALL_TOKENS', 'false').lower() == 'true'
+        self.include_project_tokens = _env_bool('INCLUDE_PROJECT_TOKENS', 'true')
+        self.include_group_tokens = _env_bool('INCLUDE_GROUP_TOKENS', 'true')
+        self.send_all_tokens = _env_bool('SEND_ALL_TOKENS', 'false')
+        self.max_workers = int(os.getenv('MAX_WORKERS', '16'))  # Concurrent GitLab API requests
+        self.http2 = _env_bool('GITLAB_HTTP2', 'false')  # Requires httpx[http2]
+        
+        # User/group lookups and response ETags kept between runs; an empty CACHE_PATH disables it
+        self.cache_path = os.getenv('CACHE_PATH', '.cache/gitlab_token_monitor.sqlite')
+        self.cache_ttl_hours = int(os.getenv('CACHE_TTL_HOURS', '24'))
         
         # Validate required configuration
         self._validate_config()
     
     def _validate_config(self):
-        """Validate required configuration"""
-        print(f"Validating configuration...")
-        print(f"GitLab URL: {self.gitlab_url}")
-        print(f"Admin Token: {'Set' if self.admin_token and self.admin_token != 'your-admin-token' else 'NOT SET'}")
-        print(f"From Email: {self.smtp_config['from_email']}")
-        print(f"To Emails: {self.smtp_config['to_emails']}")
+        """Check the settings the monitor cannot run without.
+
+        Completeness of the documented variables is checked ahead of time by
+        tools/validate_config.py, so only the required values are checked here.
+        """
+        log.debug("GitLab URL: %s", self.gitlab_url)
+        log.debug("From Email: %s", self.smtp_config['from_email'])
+        log.debug("To Emails: %s", self.smtp_config['to_emails'])
         
         if not self.admin_token or self.admin_token == 'your-admin-token':
-            print("❌ Error: GITLAB_ADMIN_TOKEN environment variable is required")
-            print("Set it with: export GITLAB_ADMIN_TOKEN='your-token-here'")
+            log.error("❌ GITLAB_ADMIN_TOKEN environment variable is required. "
+                      "Set it with: export GITLAB_ADMIN_TOKEN='your-token-here'")
             sys.exit(1)
         
         if not self.smtp_config['from_email'] or self.smtp_config['from_email'] == 'alerts@yourcompany.com':
-            print("❌ Error: FROM_EMAIL environment variable is required")
-            print("Set it with: export FROM_EMAIL='your-email@company.com'")
+            log.error("❌ FROM_EMAIL environment variable is required. "
+                      "Set it with: export FROM_EMAIL='your-email@company.com'")
             sys.exit(1)
-            
-        print("✅ Configuration validation passed!")
     
     def get_headers(self) -> Dict[str, str]:
         """Get GitLab API headers"""
         return {
             'PRIVATE-TOKEN': self.admin_token,
-            'Content-Type': 'application/json'
-        }
\ No newline at end of file
+            # GETs carry no body; ask for compressed JSON instead
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate'
+        }
+
+@lru_cache(maxsize=1)
+def get_config() -> Config:
+    """Get the process-wide configuration, reading the environment only once"""
+    return Config()
@@ -5,267 +5,349 @@ Handles email notifications and HTML report generation
 """
 
 import smtplib
+from contextlib import contextmanager
 from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List, Optional
 from token_analyzer import TokenAnalyzer
+from token_model import Token
+
+_HTML_ESCAPE = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'})
+
+def _escape(value, default: str = '') -> str:
+    """HTML-escape a value in a single str.translate pass, using `default` for None"""
+    return str(default if value is None else value).translate(_HTML_ESCAPE)
+
+_TABLE_HEADERS = {
+    'personal': ['Token Name', 'User', 'Email', 'Expires At', 'Status', 'Days Until Expiry', 'Scopes'],
+    'project': ['Token Name', 'Project', 'Project Path', 'Expires At', 'Status', 'Days Until Expiry', 'Access Level'],
+    'group': ['Token Name', 'Group', 'Group Path', 'Expires At', 'Status', 'Days Until Expiry', 'Access Level', 'Scopes']
+}
+
+# Row templates are parsed once here and filled per token with str.format_map;
+# every value placed in them must already be passed through _escape
+_PERSONAL_ROW = (
+    '<tr><td>{name}</td><td>{username}</td><td>{email}</td><td>{expires_at}</td>'
+    '<td class="{cls}">{status}</td><td class="{cls}">{days}</td><td>{scopes}</td></tr>'
+)
+_PROJECT_ROW = (
+    '<tr><td>{name}</td><td>{project_name}</td><td>{project_path}</td><td>{expires_at}</td>'
+    '<td class="{cls}">{status}</td><td class="{cls}">{days}</td><td>{access_level}</td></tr>'
+)
+_GROUP_ROW = (
+    '<tr><td>{name}</td><td>{group_name}</td><td>{group_path}</td><td>{expires_at}</td>'
+    '<td class="{cls}">{status}</td><td class="{cls}">{days}</td><td>{access_level}</td><td>{scopes}</td></tr>'
+)
+
+# Invariant parts of the report, built once at import time
+_EMAIL_HEAD = """
+<html>
+<head>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 20px; }
+        .summary { background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin: 20px 0; }
+        .summary h3 { margin-top: 0; color: #333; }
+        .stats { display: flex; gap: 20px; flex-wrap: wrap; }
+        .stat-box { background: white; padding: 10px; border-radius: 5px; border-left: 4px solid #007bff; min-width: 120px; }
+        .stat-number { font-size: 24px; font-weight: bold; color: #333; }
+        .stat-label { color: #666; font-size: 14px; }
+        table { border-collapse: collapse; width: 100%; margin: 20px 0; }
+        th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
+        th { background-color: #f2f2f2; font-weight: bold; }
+        .expired { color: red; font-weight: bold; }
+        .expiring { color: orange; font-weight: bold; }
+        .healthy { color: green; }
+        .no-expiration { color: blue; }
+        .section { margin: 30px 0; }
+        .section h3 { color: #333; border-bottom: 2px solid #007bff; padding-bottom: 5px; }
+        .token-type { margin: 20px 0; }
+        .token-type h4 { color: #555; margin: 15px 0 10px 0; }
+        .collapsible { margin: 10px 0; }
+        .collapsible summary { cursor: pointer; font-weight: bold; padding: 10px; background: #f8f9fa; border-radius: 5px; }
+        .collapsible[open] summary { background: #e9ecef; }
+    </style>
+</head>
+<body>
+    <h2>GitLab Token Comprehensive Report</h2>
+"""
+
+# Filled with str.format_map(stats)
+_SUMMARY_TMPL = """
+<div class="summary">
+    <h3>Token Status Summary</h3>
+    <div class="stats">
+        <div class="stat-box">
+            <div class="stat-number">{total_tokens}</div>
+            <div class="stat-label">Total Tokens</div>
+        </div>
+        <div class="stat-box">
+            <div class="stat-number expired">{expired_count}</div>
+            <div class="stat-label">Expired</div>
+        </div>
+        <div class="stat-box">
+            <div class="stat-number expiring">{expiring_count}</div>
+            <div class="stat-label">Expiring Soon</div>
+        </div>
+        <div class="stat-box">
+            <div class="stat-number healthy">{healthy_count}</div>
+            <div class="stat-label">Healthy</div>
+        </div>
+        <div class="stat-box">
+            <div class="stat-number no-expiration">{permanent_count}</div>
+            <div class="stat-label">No Expiration</div>
+        </div>
+    </div>
+</div>
+"""
+
+# Filled with str.format(gitlab_url=...)
+_EMAIL_FOOTER_TMPL = """
+    <div class="section">
+        <h3>Next Steps</h3>
+        <p><strong>For Expired/Expiring Tokens:</strong></p>
+        <ul>
+            <li>Review and renew tokens before they expire to avoid service interruptions</li>
+            <li>Consider setting longer expiration periods for critical service tokens</li>
+            <li>Update any automated systems using these tokens</li>
+        </ul>
+
+        <p><strong>Token Management:</strong></p>
+        <ul>
+            <li><a href="{gitlab_url}/profile/personal_access_tokens">Personal Access Tokens</a></li>
+            <li><a href="{gitlab_url}/admin/application_settings/general#js-access-token-settings">Admin Token Settings</a></li>
+        </ul>
+    </div>
+</body>
+</html>
+"""
 
 class EmailReporter:
     def __init__(self, smtp_config: Dict, gitlab_url: str, gitlab_api):
         self.smtp_config = smtp_config
         self.gitlab_url = gitlab_url
         self.gitlab_api = gitlab_api
+        self._user_cache: Dict[int, Optional[Dict]] = {}
+        self._group_cache: Dict[int, Optional[Dict]] = {}
     
-    def send_notification(self, token_analysis: Dict):
+    def send_notification(self, token_analysis: Dict, stats: Optional[Dict[str, int]] = None):
         """Send email notification about all tokens with their status"""
-        stats = TokenAnalyzer.get_summary_stats(token_analysis)
-        
-        # Check if we should send email
-        if not token_analysis.get('include_all_tokens', False) and stats['problematic_count'] == 0:
+        msg = self._build_message(token_analysis, stats)
+        if msg is None:
             print("No expiring tokens found, skipping email notification")
             return
-            
-        # Create email content
-        if stats['problematic_count'] > 0:
-            subject = f"GitLab Token Report - {stats['problematic_count']}/{stats['total_tokens']} tokens need attention"
-        else:
-            subject = f"GitLab Token Report - All {stats['total_tokens']} tokens are healthy"
-        
-        body = self._create_comprehensive_email_body(token_analysis)
         
         # Send email
         try:
-            msg = MIMEMultipart()
-            msg['From'] = self.smtp_config['from_email']
-            msg['To'] = ', '.join(self.smtp_config['to_emails'])
-            msg['Subject'] = subject
+            with self.smtp_session() as server:
+                server.send_message(msg)
             
-            msg.attach(MIMEText(body, 'html'))
+            print(f"Email notification sent successfully to {', '.join(self.smtp_config['to_emails'])}")
             
-            if self.smtp_config.get('use_ssl', True):
-                server = smtplib.SMTP_SSL(self.smtp_config['smtp_server'], self.smtp_config['smtp_port'])
-            else:
-                server = smtplib.SMTP(self.smtp_config['smtp_server'], self.smtp_config['smtp_port'])
-                if self.smtp_config.get('use_tls'):
-                    server.starttls()
+        except Exception as e:
+            print(f"Error sending email: {e}")
+    
+    def send_all(self, token_analyses: Iterable[Dict]):
+        """Send several reports over a single SMTP connection"""
+        messages = [msg for msg in map(self._build_message, token_analyses) if msg is not None]
+        if not messages:
+            print("No expiring tokens found, skipping email notification")
+            return
+        
+        sent = 0
+        try:
+            with self.smtp_session() as server:
+                for msg in messages:
+                    try:
+                        server.send_message(msg)
+                        sent += 1
+                    except smtplib.SMTPException as e:
+                        print(f"Error sending email '{msg['Subject']}': {e}")
+        except Exception as e:
+            print(f"Error sending email: {e}")
+        
+        print(f"Sent {sent}/{len(messages)} email reports to {', '.join(self.smtp_config['to_emails'])}")
+    
+    @contextmanager
+    def smtp_session(self) -> Iterator[smtplib.SMTP]:
+        """Open and authenticate one SMTP connection, closing it on exit"""
+        if self.smtp_config.get('use_ssl', True):
+            server = smtplib.SMTP_SSL(self.smtp_config['smtp_server'], self.smtp_config['smtp_port'])
+        else:
+            server = smtplib.SMTP(self.smtp_config['smtp_server'], self.smtp_config['smtp_port'])
+        
+        try:
+            if not self.smtp_config.get('use_ssl', True) and self.smtp_config.get('use_tls'):
+                server.starttls()
             
             if self.smtp_config.get('username'):
                 server.login(self.smtp_config['username'], self.smtp_config['password'])
-                
-            server.send_message(msg)
-            server.quit()
             
-            print(f"Email notification sent successfully to {', '.join(self.smtp_config['to_emails'])}")
+            yield server
+        finally:
+            try:
+                server.quit()
+            except (smtplib.SMTPException, OSError):
+                server.close()
+    
+    def _build_message(self, token_analysis: Dict, stats: Optional[Dict[str, int]] = None) -> Optional[MIMEText]:
+        """Build the report email, or return None when there is nothing to send"""
+        if stats is None:
+            stats = TokenAnalyzer.get_summary_stats(token_analysis)
+        
+        # Check if we should send email
+        if not token_analysis.get('include_all_tokens', False) and stats['problematic_count'] == 0:
+            return None
             
-        except Exception as e:
-            print(f"Error sending email: {e}")
+        # Create email content
+        if stats['problematic_count'] > 0:
+            subject = f"GitLab Token Report - {stats['problematic_count']}/{stats['total_tokens']} tokens need attention"
+        else:
+            subject = f"GitLab Token Report - All {stats['total_tokens']} tokens are healthy"
+        
+        body = self._create_comprehensive_email_body(token_analysis, stats)
+        
+        # A single HTML part needs no multipart container
+        msg = MIMEText(body, 'html', 'utf-8')
+        msg['From'] = self.smtp_config['from_email']
+        msg['To'] = ', '.join(self.smtp_config['to_emails'])
+        msg['Subject'] = subject
+        return msg
     
-    def _create_comprehensive_email_body(self, token_analysis: Dict) -> str:
+    def _create_comprehensive_email_body(self, token_analysis: Dict, stats: Optional[Dict[str, int]] = None) -> str:
         """Create comprehensive HTML email body with all token information"""
+        if stats is None:
+            stats = TokenAnalyzer.get_summary_stats(token_analysis)
         
-        # Group tokens by type for each category
-        expired_by_type = TokenAnalyzer.group_tokens_by_type(token_analysis['expired'])
-        expiring_by_type = TokenAnalyzer.group_tokens_by_type(token_analysis['expiring_soon'])
-        healthy_by_type = TokenAnalyzer.group_tokens_by_type(token_analysis['healthy'])
-        no_exp_by_type = TokenAnalyzer.group_tokens_by_type(token_analysis['no_expiration'])
+        self._prefetch_lookups(token_analysis)
+        return ''.join(self._iter_email_body_parts(token_analysis, stats))
+    
+    def _prefetch_lookups(self, token_analysis: Dict):
+        """Fetch owner details for every token in the report before rendering it"""
+        categories = ['expired', 'expiring_soon']
+        if token_analysis.get('include_all_tokens', False):
+            categories += ['healthy', 'no_expiration']
         
-        stats = TokenAnalyzer.get_summary_stats(token_analysis)
+        user_ids, group_ids = set(), set()
+        for category in categories:
+            for token in token_analysis[category]:
+                if token.token_type == 'group':
+                    if token.group_id:
+                        group_ids.add(token.group_id)
+                elif not token.token_type and token.user_id:
+                    user_ids.add(token.user_id)
         
-        html = f"""
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; margin: 20px; }}
-                .summary {{ background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin: 20px 0; }}
-                .summary h3 {{ margin-top: 0; color: #333; }}
-                .stats {{ display: flex; gap: 20px; flex-wrap: wrap; }}
-                .stat-box {{ background: white; padding: 10px; border-radius: 5px; border-left: 4px solid #007bff; min-width: 120px; }}
-                .stat-number {{ font-size: 24px; font-weight: bold; color: #333; }}
-                .stat-label {{ color: #666; font-size: 14px; }}
-                table {{ border-collapse: collapse; width: 100%; margin: 20px 0; }}
-                th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
-                th {{ background-color: #f2f2f2; font-weight: bold; }}
-                .expired {{ color: red; font-weight: bold; }}
-                .expiring {{ color: orange; font-weight: bold; }}
-                .healthy {{ color: green; }}
-                .no-expiration {{ color: blue; }}
-                .section {{ margin: 30px 0; }}
-                .section h3 {{ color: #333; border-bottom: 2px solid #007bff; padding-bottom: 5px; }}
-                .token-type {{ margin: 20px 0; }}
-                .token-type h4 {{ color: #555; margin: 15px 0 10px 0; }}
-                .collapsible {{ margin: 10px 0; }}
-                .collapsible summary {{ cursor: pointer; font-weight: bold; padding: 10px; background: #f8f9fa; border-radius: 5px; }}
-                .collapsible[open] summary {{ background: #e9ecef; }}
-            </style>
-        </head>
-        <body>
-            <h2>GitLab Token Comprehensive Report</h2>
-            
-            <div class="summary">
-                <h3>Token Status Summary</h3>
-                <div class="stats">
-                    <div class="stat-box">
-                        <div class="stat-number">{stats['total_tokens']}</div>
-                        <div class="stat-label">Total Tokens</div>
-                    </div>
-                    <div class="stat-box">
-                        <div class="stat-number expired">{stats['expired_count']}</div>
-                        <div class="stat-label">Expired</div>
-                    </div>
-                    <div class="stat-box">
-                        <div class="stat-number expiring">{stats['expiring_count']}</div>
-                        <div class="stat-label">Expiring Soon</div>
-                    </div>
-                    <div class="stat-box">
-                        <div class="stat-number healthy">{stats['healthy_count']}</div>
-                        <div class="stat-label">Healthy</div>
-                    </div>
-                    <div class="stat-box">
-                        <div class="stat-number no-expiration">{stats['permanent_count']}</div>
-                        <div class="stat-label">No Expiration</div>
-                    </div>
-                </div>
-            </div>
-        """
+        # Distinct IDs are fetched concurrently, so the render loop never waits on the network
+        self._user_cache = self.gitlab_api.get_users_info(user_ids)
+        self._group_cache = self.gitlab_api.get_groups_info(group_ids)
+    
+    def _iter_email_body_parts(self, token_analysis: Dict, stats: Dict[str, int]) -> Iterator[str]:
+        """Yield the HTML email body piece by piece"""
+        include_all_tokens = token_analysis.get('include_all_tokens', False)
+        
+        yield _EMAIL_HEAD
+        yield _SUMMARY_TMPL.format_map(stats)
+        
+        # Each category is grouped by token type only once its section is rendered,
+        # so empty or suppressed categories are never walked
         
         # Critical tokens (expired + expiring soon)
         if stats['expired_count'] > 0 or stats['expiring_count'] > 0:
-            html += '<div class="section"><h3>🚨 Tokens Requiring Immediate Attention</h3>'
+            yield '<div class="section"><h3>🚨 Tokens Requiring Immediate Attention</h3>'
             
             if stats['expired_count'] > 0:
-                html += '<h4 class="expired">Expired Tokens</h4>'
+                yield '<h4 class="expired">Expired Tokens</h4>'
+                expired_by_type = TokenAnalyzer.group_tokens_by_type(token_analysis['expired'])
                 for token_type in ['personal', 'project', 'group']:
                     if expired_by_type[token_type]:
-                        html += f'<h5>{token_type.title()} Access Tokens</h5>'
-                        html += self._create_token_table(expired_by_type[token_type], token_type, 'expired')
+                        yield f'<h5>{token_type.title()} Access Tokens</h5>'
+                        yield self._create_token_table(expired_by_type[token_type], token_type, 'expired')
             
             if stats['expiring_count'] > 0:
-                html += '<h4 class="expiring">Expiring Soon</h4>'
+                yield '<h4 class="expiring">Expiring Soon</h4>'
+                expiring_by_type = TokenAnalyzer.group_tokens_by_type(token_analysis['expiring_soon'])
                 for token_type in ['personal', 'project', 'group']:
                     if expiring_by_type[token_type]:
-                        html += f'<h5>{token_type.title()} Access Tokens</h5>'
-                        html += self._create_token_table(expiring_by_type[token_type], token_type, 'expiring')
+                        yield f'<h5>{token_type.title()} Access Tokens</h5>'
+                        yield self._create_token_table(expiring_by_type[token_type], token_type, 'expiring')
             
-            html += '</div>'
+            yield '</div>'
         
         # Healthy tokens (collapsible)
-        if stats['healthy_count'] > 0:
-            html += f'''
+        if include_all_tokens and stats['healthy_count'] > 0:
+            yield f'''
             <div class="section">
                 <details class="collapsible">
                     <summary>✅ Healthy Tokens ({stats['healthy_count']})</summary>
                     <div class="token-type">
             '''
             
+            healthy_by_type = TokenAnalyzer.group_tokens_by_type(token_analysis['healthy'])
             for token_type in ['personal', 'project', 'group']:
                 if healthy_by_type[token_type]:
-                    html += f'<h4>{token_type.title()} Access Tokens</h4>'
-                    html += self._create_token_table(healthy_by_type[token_type], token_type, 'healthy')
+                    yield f'<h4>{token_type.title()} Access Tokens</h4>'
+                    yield self._create_token_table(healthy_by_type[token_type], token_type, 'healthy')
             
-            html += '</div></details></div>'
+            yield '</div></details></div>'
         
         # No expiration tokens (collapsible)
-        if stats['permanent_count'] > 0:
-            html += f'''
+        if include_all_tokens and stats['permanent_count'] > 0:
+            yield f'''
             <div class="section">
                 <details class="collapsible">
                     <summary>♾️ Tokens with No Expiration ({stats['permanent_count']})</summary>
                     <div class="token-type">
             '''
             
+            no_exp_by_type = TokenAnalyzer.group_tokens_by_type(token_analysis['no_expiration'])
             for token_type in ['personal', 'project', 'group']:
                 if no_exp_by_type[token_type]:
-                    html += f'<h4>{token_type.title()} Access Tokens</h4>'
-                    html += self._create_token_table(no_exp_by_type[token_type], token_type, 'no-expiration')
+                    yield f'<h4>{token_type.title()} Access Tokens</h4>'
+                    yield self._create_token_table(no_exp_by_type[token_type], token_type, 'no-expiration')
             
-            html += '</div></details></div>'
+            yield '</div></details></div>'
         
-        html += f"""
-            <div class="section">
-                <h3>Next Steps</h3>
-                <p><strong>For Expired/Expiring Tokens:</strong></p>
-                <ul>
-                    <li>Review and renew tokens before they expire to avoid service interruptions</li>
-                    <li>Consider setting longer expiration periods for critical service tokens</li>
-                    <li>Update any automated systems using these tokens</li>
-                </ul>
-                
-                <p><strong>Token Management:</strong></p>
-                <ul>
-                    <li><a href="{self.gitlab_url}/profile/personal_access_tokens">Personal Access Tokens</a></li>
-                    <li><a href="{self.gitlab_url}/admin/application_settings/general#js-access-token-settings">Admin Token Settings</a></li>
-                </ul>
-            </div>
-        </body>
-        </html>
-        """
-        
-        return html
+        yield _EMAIL_FOOTER_TMPL.format(gitlab_url=self.gitlab_url)
     
-    def _create_token_table(self, tokens: List[Dict], token_type: str, status_class: str = "") -> str:
+    def _create_token_table(self, tokens: List[Token], token_type: str, status_class: str = "") -> str:
         """Create HTML table for tokens"""
         if not tokens:
             return "<p><em>No tokens in this category</em></p>"
+        
+        if token_type not in _TABLE_HEADERS:
+            return ''
+        
+        parts = ['<table><tr>', *(f'<th>{h}</th>' for h in _TABLE_HEADERS[token_type]), '</tr>']
+        
+        for token in tokens:
+            # days_until_expiry is None for permanent tokens and unparseable dates
+            days = token.days_until_expiry
+            if days is None:
+                days = 'Unknown' if token.expires_at else 'Never'
+            row = {
+                'name': _escape(token.name, 'Unnamed'),
+                'expires_at': _escape(token.expires_at, 'Never'),
+                'cls': status_class,
+                'status': _escape(token.status, 'Unknown'),
+                'days': _escape(days),
+                'access_level': _escape(token.access_level, 'Unknown'),
+                'scopes': _escape(', '.join(token.scopes))
+            }
             
-        if token_type == 'personal':
-            headers = ['Token Name', 'User', 'Email', 'Expires At', 'Status', 'Days Until Expiry', 'Scopes']
-            table_html = f'<table><tr>{"".join(f"<th>{h}</th>" for h in headers)}</tr>'
-            
-            for token in tokens:
-                user_info = self.gitlab_api.get_user_info(token['user_id']) if token.get('user_id') else {}
-                username = user_info.get('username', 'Unknown') if user_info else 'Unknown'
-                email = user_info.get('email', 'Unknown') if user_info else 'Unknown'
-                
-                table_html += f"""
-                <tr>
-                    <td>{token.get('name', 'Unnamed')}</td>
-                    <td>{username}</td>
-                    <td>{email}</td>
-                    <td>{token.get('expires_at', 'Never')}</td>
-                    <td class="{status_class}">{token.get('status', 'Unknown')}</td>
-                    <td class="{status_class}">{token['days_until_expiry']}</td>
-                    <td>{', '.join(token.get('scopes', []))}</td>
-                </tr>
-                """
-                
-        elif token_type == 'project':
-            headers = ['Token Name', 'Project', 'Project Path', 'Expires At', 'Status', 'Days Until Expiry', 'Access Level']
-            table_html = f'<table><tr>{"".join(f"<th>{h}</th>" for h in headers)}</tr>'
-            
-            for token in tokens:
-                table_html += f"""
-                <tr>
-                    <td>{token.get('name', 'Unnamed')}</td>
-                    <td>{token.get('project_name', 'Unknown')}</td>
-                    <td>{token.get('project_path', 'Unknown')}</td>
-                    <td>{token.get('expires_at', 'Never')}</td>
-                    <td class="{status_class}">{token.get('status', 'Unknown')}</td>
-                    <td class="{status_class}">{token['days_until_expiry']}</td>
-                    <td>{token.get('access_level', 'Unknown')}</td>
-                </tr>
-                """
+            if token_type == 'personal':
+                user_info = self._user_cache.get(token.user_id) if token.user_id else {}
+                row['username'] = _escape(user_info.get('username', 'Unknown') if user_info else 'Unknown')
+                row['email'] = _escape(user_info.get('email', 'Unknown') if user_info else 'Unknown')
+                parts.append(_PERSONAL_ROW.format_map(row))
                 
-        elif token_type == 'group':
-            headers = ['Token Name', 'Group', 'Group Path', 'Expires At', 'Status', 'Days Until Expiry', 'Access Level', 'Scopes']
-            table_html = f'<table><tr>{"".join(f"<th>{h}</th>" for h in headers)}</tr>'
-            
-            for token in tokens:
-                group_info = self.gitlab_api.get_group_info(token['group_id']) if token.get('group_id') else {}
-                group_name = group_info.get('name', 'Unknown') if group_info else 'Unknown'
-                group_path = group_info.get('full_path', 'Unknown') if group_info else 'Unknown'
+            elif token_type == 'project':
+                row['project_name'] = _escape(token.project_name, 'Unknown')
+                row['project_path'] = _escape(token.project_path, 'Unknown')
+                parts.append(_PROJECT_ROW.format_map(row))
                 
-                table_html += f"""
-                <tr>
-                    <td>{token.get('name', 'Unnamed')}</td>
-                    <td>{group_name}</td>
-                    <td>{group_path}</td>
-                    <td>{token.get('expires_at', 'Never')}</td>
-                    <td class="{status_class}">{token.get('status', 'Unknown')}</td>
-                    <td class="{status_class}">{token['days_until_expiry']}</td>
-                    <td>{token.get('access_level', 'Unknown')}</td>
-                    <td>{', '.join(token.get('scopes', []))}</td>
-                </tr>
-                """
+            else:
+                group_info = self._group_cache.get(token.group_id) if token.group_id else {}
+                row['group_name'] = _escape(group_info.get('name', 'Unknown') if group_info else 'Unknown')
+                row['group_path'] = _escape(group_info.get('full_path', 'Unknown') if group_info else 'Unknown')
+                parts.append(_GROUP_ROW.format_map(row))
         
-        table_html += '</table>'
-        return table_html
\ No newline at end of file
+        parts.append('</table>')
+        return ''.join(parts)
@@ -4,125 +4,246 @@ GitLab API Client
 Handles all GitLab API interactions for token management
 """
 
+import logging
+import orjson
 import requests
-from typing import List, Dict, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from metadata_cache import MetadataCache
+from token_model import Token
+
+# httpx with the h2 extra is optional and only used when HTTP/2 is requested
+try:
+    import h2  # noqa: F401
+    import httpx
+except ImportError:
+    httpx = None
+
+_HTTP_ERRORS = (requests.exceptions.RequestException,) + ((httpx.HTTPError,) if httpx else ())
+_TIMEOUT = 30.0
+
+log = logging.getLogger(__name__)
 
 class GitLabAPI:
-    def __init__(self, gitlab_url: str, headers: Dict[str, str]):
+    def __init__(self, gitlab_url: str, headers: Dict[str, str], max_workers: int = 16,
+                 cache: Optional[MetadataCache] = None, http2: bool = False):
         self.gitlab_url = gitlab_url.rstrip('/')
         self.headers = headers
+        self.max_workers = max_workers
+        self.cache = cache
+        
+        if http2 and httpx is None:
+            log.warning("HTTP/2 requested but httpx[http2] is not installed, falling back to HTTP/1.1")
+        # Listing pages are prefetched on their own max_workers threads while the
+        # per-ID fan-out runs, so the connection pool serves both at once
+        pool_size = 2 * max_workers
+        if http2 and httpx is not None:
+            self.session = self._create_http2_client(headers, pool_size)
+        else:
+            self.session = self._create_session(headers, pool_size)
+        # Lookups are repeated across report sections, so remember each ID's result
+        self._user_cache: Dict[int, Optional[Dict]] = {}
+        self._group_cache: Dict[int, Optional[Dict]] = {}
     
-    def get_personal_access_tokens(self) -> List[Dict]:
-        """Get all personal access tokens from GitLab"""
-        url = f"{self.gitlab_url}/api/v4/personal_access_tokens"
+    @staticmethod
+    def _create_session(headers: Dict[str, str], pool_size: int) -> requests.Session:
+        """Create a pooled, keep-alive session shared by all API calls"""
+        session = requests.Session()
+        session.headers.update(headers)
+        # Size the pool to the concurrent request count so fetches never block on a connection
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=5,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=['GET']  # only idempotent reads; Retry-After is honoured
+            )
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+    
+    @staticmethod
+    def _create_http2_client(headers: Dict[str, str], pool_size: int) -> 'httpx.Client':
+        """Create an HTTP/2 client that multiplexes concurrent calls over few connections"""
+        # httpx only retries failed connection attempts, not 429/5xx responses
+        transport = httpx.HTTPTransport(
+            http2=True,
+            retries=3,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=8)
+        )
+        return httpx.Client(headers=headers, transport=transport, timeout=_TIMEOUT)
+    
+    def _get(self, url: str, params: Optional[Dict] = None, default: Any = None) -> Any:
+        """GET a URL and decode its JSON body, returning `default` on any request error"""
         try:
-            response = requests.get(url, headers=self.headers)
+            return self._get_json(url, params)
+        except _HTTP_ERRORS as e:
+            log.warning("GET %s failed: %s", url, e)
+            return default
+    
+    def _get_json(self, url: str, params: Optional[Dict] = None):
+        """GET a URL and decode its JSON body, raising on HTTP errors"""
+        if self.cache is None:
+            response = self.session.get(url, params=params, timeout=_TIMEOUT)
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching personal access tokens: {e}")
-            return []
+            return self._decode(response.content, response)
+        
+        # Revalidate against the last seen ETag; an unchanged resource comes back
+        # as an empty 304 and the stored body is reused
+        cache_key = requests.Request('GET', url, params=params).prepare().url
+        cached = self.cache.get_response(cache_key)
+        headers = {'If-None-Match': cached[0]} if cached else None
+        
+        response = self.session.get(url, params=params, headers=headers, timeout=_TIMEOUT)
+        if response.status_code == 304 and cached:
+            return self._decode(cached[1], response)
+        
+        response.raise_for_status()
+        etag = response.headers.get('ETag')
+        if etag:
+            self.cache.set_response(cache_key, etag, response.content)
+        return self._decode(response.content, response)
     
-    def get_project_access_tokens(self, project_id: int) -> List[Dict]:
-        """Get project access tokens for a specific project"""
-        url = f"{self.gitlab_url}/api/v4/projects/{project_id}/access_tokens"
+    @staticmethod
+    def _decode(content: bytes, response):
+        """Decode a JSON response body with orjson"""
+        # orjson decodes the raw bytes directly, skipping the text decode step;
+        # decode errors are re-raised as a RequestException so _get handles them
         try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            tokens = response.json()
-            # Add token type for identification
-            for token in tokens:
-                token['token_type'] = 'project'
-                token['project_id'] = project_id
-            return tokens
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching project access tokens for project {project_id}: {e}")
-            return []
-    
-    def get_group_access_tokens(self, group_id: int) -> List[Dict]:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError as e:
+            raise requests.exceptions.ContentDecodingError(e, response=response)
+    
+    def get_personal_access_tokens(self) -> List[Token]:
+        """Get all personal access tokens from GitLab"""
+        tokens = self._get(f"{self.gitlab_url}/api/v4/personal_access_tokens", default=[])
+        return [Token.from_api(token) for token in tokens]
+    
+    def get_project_access_tokens(self, project_id: int) -> List[Token]:
+        """Get project access tokens for a specific project"""
+        tokens = self._get(f"{self.gitlab_url}/api/v4/projects/{project_id}/access_tokens", default=[])
+        # Add token type for identification
+        return [Token.from_api(token, token_type='project', project_id=project_id) for token in tokens]
+    
+    def get_group_access_tokens(self, group_id: int) -> List[Token]:
         """Get group access tokens for a specific group"""
-        url = f"{self.gitlab_url}/api/v4/groups/{group_id}/access_tokens"
-        try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            tokens = response.json()
-            # Add token type for identification
-            for token in tokens:
-                token['token_type'] = 'group'
-                token['group_id'] = group_id
-            return tokens
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching group access tokens for group {group_id}: {e}")
-            return []
+        tokens = self._get(f"{self.gitlab_url}/api/v4/groups/{group_id}/access_tokens", default=[])
+        # Add token type for identification
+        return [Token.from_api(token, token_type='group', group_id=group_id) for token in tokens]
+    
+    def get_all_project_access_tokens(self, project_ids: Iterable[int]) -> Dict[int, List[Token]]:
+        """Get project access tokens for many projects concurrently, keyed by project ID"""
+        return self._fetch_concurrently(self.get_project_access_tokens, project_ids)
+    
+    def get_all_group_access_tokens(self, group_ids: Iterable[int]) -> Dict[int, List[Token]]:
+        """Get group access tokens for many groups concurrently, keyed by group ID"""
+        return self._fetch_concurrently(self.get_group_access_tokens, group_ids)
+    
+    def get_users_info(self, user_ids: Iterable[int]) -> Dict[int, Optional[Dict]]:
+        """Get information for many users concurrently, keyed by user ID"""
+        return self._fetch_concurrently(self.get_user_info, user_ids)
+    
+    def get_groups_info(self, group_ids: Iterable[int]) -> Dict[int, Optional[Dict]]:
+        """Get information for many groups concurrently, keyed by group ID"""
+        return self._fetch_concurrently(self.get_group_info, group_ids)
+    
+    def _fetch_concurrently(self, fetch: Callable[[int], Any], ids: Iterable[int]) -> Dict[int, Any]:
+        """Run a per-ID fetch method across a thread pool, preserving input order"""
+        # The per-ID methods already swallow request errors, so one failing
+        # project or group never aborts the rest of the batch
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(fetch, resource_id): resource_id for resource_id in ids}
+            return {resource_id: future.result() for future, resource_id in futures.items()}
     
     def get_all_groups(self) -> List[Dict]:
         """Get all groups in GitLab instance"""
-        url = f"{self.gitlab_url}/api/v4/groups"
-        params = {'simple': 'true', 'per_page': 100, 'all_available': 'true'}
-        groups = []
-        page = 1
-        
-        try:
-            while True:
-                params['page'] = page
-                response = requests.get(url, headers=self.headers, params=params)
-                response.raise_for_status()
-                
-                page_groups = response.json()
-                if not page_groups:
-                    break
-                    
-                groups.extend(page_groups)
-                page += 1
-                
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching groups: {e}")
-            
-        return groups
+        return list(self.iter_all_groups())
     
     def get_all_projects(self) -> List[Dict]:
         """Get all projects in GitLab instance"""
+        return list(self.iter_all_projects())
+    
+    def iter_all_groups(self) -> Iterator[Dict]:
+        """Yield all groups in GitLab instance as their pages arrive"""
+        url = f"{self.gitlab_url}/api/v4/groups"
+        params = {'simple': 'true', 'per_page': 100, 'all_available': 'true'}
+        return self._iter_all_pages(url, params, 'groups')
+    
+    def iter_all_projects(self) -> Iterator[Dict]:
+        """Yield all projects in GitLab instance as their pages arrive"""
         url = f"{self.gitlab_url}/api/v4/projects"
-        params = {'simple': 'true', 'per_page': 100}
-        projects = []
-        page = 1
-        
+        # Archived projects are read-only, so their tokens are not worth a request each
+        params = {'simple': 'true', 'per_page': 100, 'archived': 'false'}
+        return self._iter_all_pages(url, params, 'projects')
+    
+    def _iter_all_pages(self, url: str, params: Dict, description: str) -> Iterator[Dict]:
+        """Yield every item of a list endpoint, fetching pages after the first concurrently"""
         try:
-            while True:
-                params['page'] = page
-                response = requests.get(url, headers=self.headers, params=params)
-                response.raise_for_status()
-                
-                page_projects = response.json()
-                if not page_projects:
-                    break
+            response = self.session.get(url, params={**params, 'page': 1}, timeout=_TIMEOUT)
+            response.raise_for_status()
+            yield from self._decode(response.content, response)
+            
+            total_pages = response.headers.get('X-Total-Pages')
+            if total_pages:
+                pages = range(2, int(total_pages) + 1)
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    for page_items in executor.map(lambda page: self._get_page(url, params, page), pages):
+                        yield from page_items
+            else:
+                # GitLab omits the page count for very large result sets,
+                # so walk the remaining pages until an empty one comes back
+                page = 2
+                while True:
+                    page_items = self._get_page(url, params, page)
+                    if not page_items:
+                        break
                     
-                projects.extend(page_projects)
-                page += 1
+                    yield from page_items
+                    page += 1
                 
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching projects: {e}")
-            
-        return projects
+        except _HTTP_ERRORS as e:
+            log.warning("Error fetching %s: %s", description, e)
+    
+    def _get_page(self, url: str, params: Dict, page: int) -> List[Dict]:
+        """Get a single page of a list endpoint"""
+        return self._get_json(url, params={**params, 'page': page})
     
     def get_user_info(self, user_id: int) -> Optional[Dict]:
-        """Get user information by ID"""
-        url = f"{self.gitlab_url}/api/v4/users/{user_id}"
-        try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching user info for ID {user_id}: {e}")
-            return None
+        """Get user information by ID, fetching each user at most once"""
+        if user_id not in self._user_cache:
+            self._user_cache[user_id] = self._cached_fetch(f'user:{user_id}', self._fetch_user_info, user_id)
+        return self._user_cache[user_id]
     
     def get_group_info(self, group_id: int) -> Optional[Dict]:
-        """Get group information by ID"""
-        url = f"{self.gitlab_url}/api/v4/groups/{group_id}"
-        try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching group info for ID {group_id}: {e}")
-            return None
\ No newline at end of file
+        """Get group information by ID, fetching each group at most once"""
+        if group_id not in self._group_cache:
+            self._group_cache[group_id] = self._cached_fetch(f'group:{group_id}', self._fetch_group_info, group_id)
+        return self._group_cache[group_id]
+    
+    def _cached_fetch(self, key: str, fetch: Callable[[int], Optional[Dict]], resource_id: int) -> Optional[Dict]:
+        """Serve a lookup from the on-disk cache, fetching and storing it on a miss"""
+        if self.cache is None:
+            return fetch(resource_id)
+        
+        info = self.cache.get(key)
+        if info is None:
+            info = fetch(resource_id)
+            if info is not None:
+                self.cache.set(key, info)
+            else:
+                # Deleted users/groups 404; don't keep their stale entry around
+                self.cache.delete(key)
+        return info
+    
+    def _fetch_user_info(self, user_id: int) -> Optional[Dict]:
+        """Fetch user information by ID"""
+        return self._get(f"{self.gitlab_url}/api/v4/users/{user_id}")
+    
+    def _fetch_group_info(self, group_id: int) -> Optional[Dict]:
+        """Fetch group information by ID"""
+        return self._get(f"{self.gitlab_url}/api/v4/groups/{group_id}")
@@ -6,187 +6,433 @@ Sends email notifications for tokens expiring within specified days
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import parse_header_links
+from urllib3.util.retry import Retry
 import json
+import re
 import smtplib
+import sqlite3
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
+from html import escape
 import sys
 import os
-from typing import List, Dict, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+from typing import Dict, Iterator, List, Optional, Set
+
+# GitLab's expires_at values: a plain date, or a timestamp with an optional offset
+_ISO_RE = re.compile(r'\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)?$')
+
+# httpx with the h2 extra is optional and only used when HTTP/2 is requested
+try:
+    import h2  # noqa: F401
+    import httpx
+except ImportError:
+    httpx = None
+
+_HTTP_ERRORS = (requests.exceptions.RequestException,) + ((httpx.HTTPError,) if httpx else ())
+_STATUS_ERRORS = (requests.exceptions.HTTPError,) + ((httpx.HTTPStatusError,) if httpx else ())
+# Response headers the page walk reads, stored with each cached page body
+_PAGINATION_HEADERS = ('X-Page', 'X-Next-Page', 'X-Total-Pages', 'Link')
+# Bounds the SMTP connect and each command, so an unreachable server can't stall a run
+_SMTP_TIMEOUT = 30
+
+# The on-disk lookup cache ships alongside the modular monitor and is optional here
+try:
+    from metadata_cache import MetadataCache
+except ImportError:
+    MetadataCache = None
+
+# orjson parses large pages several times faster; the stdlib module is the fallback
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+def _decode_json(response: requests.Response):
+    """Decode a JSON response body from its raw bytes"""
+    # Decode errors are re-raised as a RequestException so callers handle them
+    try:
+        return _json_loads(response.content)
+    except ValueError as e:
+        raise requests.exceptions.ContentDecodingError(e, response=response)
+
+@dataclass(slots=True)
+class Token:
+    """Trimmed standalone copy of token_model.Token, so this script needs no other modules"""
+    name: Optional[str] = None
+    expires_at: Optional[str] = None
+    scopes: List[str] = field(default_factory=list)
+    access_level: Optional[int] = None
+    user_id: Optional[int] = None
+    # None for personal access tokens, otherwise 'project' or 'group'
+    token_type: Optional[str] = None
+    project_id: Optional[int] = None
+    project_name: Optional[str] = None
+    project_path: Optional[str] = None
+    group_id: Optional[int] = None
+    group_name: Optional[str] = None
+    group_path: Optional[str] = None
+    days_until_expiry: Optional[int] = None
+    
+    @classmethod
+    def from_api(cls, raw: Dict, **extra) -> 'Token':
+        """Build a token from a GitLab API record, ignoring fields the monitor doesn't use"""
+        fields = {k: v for k, v in raw.items() if k in cls.__annotations__}
+        # GitLab can return "scopes": null
+        fields['scopes'] = raw.get('scopes') or []
+        return cls(**fields, **extra)
 
 class GitLabTokenMonitor:
-    def __init__(self, gitlab_url: str, admin_token: str, smtp_config: Dict):
+    def __init__(self, gitlab_url: str, admin_token: str, smtp_config: Dict, max_workers: int = 20,
+                 cache: Optional['MetadataCache'] = None, http2: bool = False):
         self.gitlab_url = gitlab_url.rstrip('/')
         self.admin_token = admin_token
         self.smtp_config = smtp_config
+        self.max_workers = max_workers
+        self.cache = cache
         self.headers = {
             'PRIVATE-TOKEN': admin_token,
-            'Content-Type': 'application/json'
+            # GETs carry no body; ask for compressed JSON instead
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate'
         }
+        if http2 and httpx is None:
+            print("HTTP/2 requested but httpx[http2] is not installed, falling back to HTTP/1.1")
+        if http2 and httpx is not None:
+            # One multiplexed HTTP/2 connection carries the concurrent fan-out;
+            # httpx only retries failed connection attempts, not 429/5xx responses
+            self.timeout = httpx.Timeout(30.0, connect=5.0)
+            self.session = httpx.Client(
+                headers=self.headers,
+                timeout=self.timeout,
+                transport=httpx.HTTPTransport(
+                    http2=True,
+                    retries=3,
+                    limits=httpx.Limits(max_connections=10, max_keepalive_connections=10)
+                )
+            )
+        else:
+            self.timeout = (5, 30)
+            self.session = self._create_session(self.headers)
+        # Service accounts often own several tokens, so remember each lookup by ID
+        self._user_cache: Dict[int, Optional[Dict]] = {}
+        self._group_cache: Dict[int, Optional[Dict]] = {}
+    
+    @staticmethod
+    def _create_session(headers: Dict[str, str]) -> requests.Session:
+        """Create a pooled keep-alive session, avoiding a TCP/TLS handshake per API call"""
+        session = requests.Session()
+        session.headers.update(headers)
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=5,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=['GET']  # only idempotent reads; Retry-After is honoured
+            )
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
     
-    def get_personal_access_tokens(self) -> List[Dict]:
-        """Get all personal access tokens from GitLab"""
+    def close(self):
+        """Close the HTTP session and its pooled connections"""
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+    
+    def get_personal_access_tokens(self, expires_before: Optional[str] = None) -> List[Token]:
+        """Get personal access tokens from GitLab, optionally only those expiring before a date"""
         url = f"{self.gitlab_url}/api/v4/personal_access_tokens"
-        try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching personal access tokens: {e}")
-            return []
+        params = {'expires_before': expires_before} if expires_before else {}
+        return [Token.from_api(raw) for raw in self._iter_pages(url, params, 'personal access tokens')]
     
-    def get_project_access_tokens(self, project_id: int) -> List[Dict]:
+    def get_project_access_tokens(self, project_id: int) -> List[Token]:
         """Get project access tokens for a specific project"""
         url = f"{self.gitlab_url}/api/v4/projects/{project_id}/access_tokens"
-        try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            tokens = response.json()
-            # Add token type for identification
-            for token in tokens:
-                token['token_type'] = 'project'
-                token['project_id'] = project_id
-            return tokens
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching project access tokens for project {project_id}: {e}")
-            return []
-    
-    def get_group_access_tokens(self, group_id: int) -> List[Dict]:
+        description = f'project access tokens for project {project_id}'
+        # Add token type for identification
+        return [Token.from_api(raw, token_type='project', project_id=project_id)
+                for raw in self._iter_pages(url, {}, description)]
+    
+    def get_group_access_tokens(self, group_id: int) -> List[Token]:
         """Get group access tokens for a specific group"""
         url = f"{self.gitlab_url}/api/v4/groups/{group_id}/access_tokens"
-        try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            tokens = response.json()
-            # Add token type for identification
-            for token in tokens:
-                token['token_type'] = 'group'
-                token['group_id'] = group_id
-            return tokens
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching group access tokens for group {group_id}: {e}")
-            return []
+        description = f'group access tokens for group {group_id}'
+        # Add token type for identification
+        return [Token.from_api(raw, token_type='group', group_id=group_id)
+                for raw in self._iter_pages(url, {}, description)]
     
     def get_all_groups(self) -> List[Dict]:
         """Get all groups in GitLab instance"""
-        url = f"{self.gitlab_url}/api/v4/groups"
-        params = {'simple': 'true', 'per_page': 100, 'all_available': 'true'}
-        groups = []
-        page = 1
-        
-        try:
-            while True:
-                params['page'] = page
-                response = requests.get(url, headers=self.headers, params=params)
-                response.raise_for_status()
-                
-                page_groups = response.json()
-                if not page_groups:
-                    break
-                    
-                groups.extend(page_groups)
-                page += 1
-                
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching groups: {e}")
-            
-        return groups
+        return list(self.iter_all_groups())
     
     def get_all_projects(self) -> List[Dict]:
         """Get all projects in GitLab instance"""
+        return list(self.iter_all_projects())
+    
+    def iter_all_groups(self) -> Iterator[Dict]:
+        """Yield all groups in GitLab instance as their pages arrive"""
+        url = f"{self.gitlab_url}/api/v4/groups"
+        params = {'simple': 'true', 'all_available': 'true'}
+        return self._iter_pages(url, params, 'groups')
+    
+    def iter_all_projects(self) -> Iterator[Dict]:
+        """Yield all projects in GitLab instance as their pages arrive"""
         url = f"{self.gitlab_url}/api/v4/projects"
-        params = {'simple': 'true', 'per_page': 100}
-        projects = []
-        page = 1
+        # Archived projects are read-only, so their tokens are not worth a request each
+        params = {'simple': 'true', 'archived': 'false'}
+        return self._iter_pages(url, params, 'projects', keyset=True)
+    
+    def _iter_pages(self, url: str, params: Dict, description: str, keyset: bool = False) -> Iterator[Dict]:
+        """Yield every item of a list endpoint, paging at the maximum page size of 100.
+
+        With keyset=True, keyset pagination is requested and its Link headers are
+        followed; endpoints that reject or ignore it fall back to offset pagination,
+        whose pages after the first are fetched in parallel.
+        """
+        params = {**params, 'per_page': 100}
         
         try:
-            while True:
-                params['page'] = page
-                response = requests.get(url, headers=self.headers, params=params)
-                response.raise_for_status()
+            if keyset:
+                keyset_params = {**params, 'pagination': 'keyset', 'order_by': 'id', 'sort': 'asc'}
+                try:
+                    headers, page_items = self._get_page(url, keyset_params)
+                except _STATUS_ERRORS as e:
+                    print(f"Keyset pagination not supported for {description} "
+                          f"(HTTP {e.response.status_code}), falling back to offset pagination")
+                    yield from self._iter_pages(url, params, description)
+                    return
                 
-                page_projects = response.json()
-                if not page_projects:
-                    break
-                    
-                projects.extend(page_projects)
-                page += 1
+                # Offset responses always carry X-Page; keyset responses only a Link header
+                if 'X-Page' not in headers:
+                    yield from page_items
+                    next_url = self._get_links(headers).get('next')
+                    while next_url:
+                        headers, page_items = self._get_page(next_url)
+                        yield from page_items
+                        next_url = self._get_links(headers).get('next')
+                    return
                 
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching projects: {e}")
+                print(f"Keyset pagination ignored for {description}, using offset pagination")
+                # Page 1 came back in id order; the remaining pages must use the same
+                # order rather than GitLab's default, or items are skipped and repeated
+                params = {**params, 'order_by': 'id', 'sort': 'asc'}
+            else:
+                headers, page_items = self._get_page(url, {**params, 'page': 1})
             
-        return projects
+            yield from page_items
+            
+            total_pages = self._get_total_pages(headers)
+            if total_pages:
+                def fetch_page(page):
+                    return self._get_page(url, {**params, 'page': page})[1]
+                
+                with ThreadPoolExecutor(max_workers=8) as executor:
+                    for page_items in executor.map(fetch_page, range(2, total_pages + 1)):
+                        yield from page_items
+            else:
+                # No page count (large result sets), so follow X-Next-Page one page at a time;
+                # responses without it are unpaginated or already the last page
+                next_page = headers.get('X-Next-Page')
+                while next_page:
+                    headers, page_items = self._get_page(url, {**params, 'page': next_page})
+                    yield from page_items
+                    next_page = headers.get('X-Next-Page')
+                
+        except _HTTP_ERRORS as e:
+            print(f"Error fetching {description}: {e}")
+    
+    def _get_page(self, url: str, params: Optional[Dict] = None):
+        """GET one page and return its pagination headers and decoded items, raising on HTTP errors"""
+        if self.cache is None:
+            response = self.session.get(url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return response.headers, _decode_json(response)
+        
+        # Revalidate against the page's last ETag; an unchanged page comes back
+        # as an empty 304 and the stored body is reused. A 304 need not repeat the
+        # pagination headers, so stored copies fill in whichever it leaves out
+        cache_key = requests.Request('GET', url, params=params).prepare().url
+        cached = self.cache.get_response(cache_key)
+        # Entries stored without their headers can't continue a walk, so refetch those
+        if cached and cached[2] is None:
+            cached = None
+        headers = {'If-None-Match': cached[0]} if cached else None
+        
+        response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and cached:
+            page_headers = CaseInsensitiveDict(cached[2])
+            page_headers.update(self._pagination_headers(response))
+            return page_headers, _json_loads(cached[1])
+        
+        response.raise_for_status()
+        etag = response.headers.get('ETag')
+        if etag:
+            self.cache.set_response(cache_key, etag, response.content, self._pagination_headers(response))
+        return response.headers, _decode_json(response)
+    
+    @staticmethod
+    def _pagination_headers(response) -> Dict[str, str]:
+        """Pick the headers the page walk reads out of a response"""
+        return {name: response.headers[name] for name in _PAGINATION_HEADERS if name in response.headers}
+    
+    @staticmethod
+    def _get_links(headers) -> Dict[str, str]:
+        """Map each rel of a Link header to its URL"""
+        return {link['rel']: link['url'] for link in parse_header_links(headers.get('Link', '')) if 'rel' in link}
+    
+    @classmethod
+    def _get_total_pages(cls, headers) -> Optional[int]:
+        """Read the total page count from X-Total-Pages or the rel="last" Link header"""
+        total_pages = headers.get('X-Total-Pages')
+        if total_pages:
+            return int(total_pages)
+        
+        last_url = cls._get_links(headers).get('last')
+        if last_url:
+            page = parse_qs(urlparse(last_url).query).get('page')
+            if page:
+                return int(page[0])
+        return None
     
     def get_user_info(self, user_id: int) -> Optional[Dict]:
-        """Get user information by ID"""
+        """Get user information by ID, fetching each user at most once"""
+        if user_id not in self._user_cache:
+            self._user_cache[user_id] = self._cached_lookup(f'user:{user_id}', self._fetch_user_info, user_id)
+        return self._user_cache[user_id]
+    
+    def get_group_info(self, group_id: int) -> Optional[Dict]:
+        """Get group information by ID, fetching each group at most once"""
+        if group_id not in self._group_cache:
+            self._group_cache[group_id] = self._cached_lookup(f'group:{group_id}', self._fetch_group_info, group_id)
+        return self._group_cache[group_id]
+    
+    def _cached_lookup(self, key: str, fetch, resource_id: int) -> Optional[Dict]:
+        """Serve a lookup from the on-disk cache between runs, fetching it on a miss"""
+        if self.cache is None:
+            return fetch(resource_id)
+        
+        info = self.cache.get(key)
+        if info is None:
+            info = fetch(resource_id)
+            if info is not None:
+                self.cache.set(key, info)
+            else:
+                # Deleted users/groups 404; don't keep their stale entry around
+                self.cache.delete(key)
+        return info
+    
+    def get_users_bulk(self, user_ids: Set[int]) -> Dict[int, Dict]:
+        """Get information for many users in one batch, keyed by user ID"""
+        return self._get_bulk(self.get_user_info, user_ids)
+    
+    def get_groups_bulk(self, group_ids: Set[int]) -> Dict[int, Dict]:
+        """Get information for many groups in one batch, keyed by group ID"""
+        return self._get_bulk(self.get_group_info, group_ids)
+    
+    def _get_bulk(self, lookup, ids: Set[int]) -> Dict[int, Dict]:
+        """Run a per-ID lookup for every distinct ID concurrently, dropping failed lookups"""
+        # /users and /groups have no multi-ID filter, so the batch is a concurrent
+        # fan-out over the pooled session rather than a single list request
+        ids = list(ids)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = executor.map(lookup, ids)
+            return {resource_id: info for resource_id, info in zip(ids, results) if info}
+    
+    def _fetch_user_info(self, user_id: int) -> Optional[Dict]:
+        """Fetch user information by ID"""
         url = f"{self.gitlab_url}/api/v4/users/{user_id}"
         try:
-            response = requests.get(url, headers=self.headers)
+            response = self.session.get(url, timeout=self.timeout)
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            return _decode_json(response)
+        except _HTTP_ERRORS as e:
             print(f"Error fetching user info for ID {user_id}: {e}")
             return None
     
-    def get_group_info(self, group_id: int) -> Optional[Dict]:
-        """Get group information by ID"""
+    def _fetch_group_info(self, group_id: int) -> Optional[Dict]:
+        """Fetch group information by ID"""
         url = f"{self.gitlab_url}/api/v4/groups/{group_id}"
         try:
-            response = requests.get(url, headers=self.headers)
+            response = self.session.get(url, timeout=self.timeout)
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            return _decode_json(response)
+        except _HTTP_ERRORS as e:
             print(f"Error fetching group info for ID {group_id}: {e}")
             return None
-        """Get user information by ID"""
-        url = f"{self.gitlab_url}/api/v4/users/{user_id}"
-        try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching user info for ID {user_id}: {e}")
-            return None
     
-    def check_token_expiration(self, tokens: List[Dict], days_threshold: int = 7) -> List[Dict]:
+    def check_token_expiration(self, tokens: List[Token], days_threshold: int = 7) -> List[Token]:
         """Check which tokens are expiring within the threshold"""
         expiring_tokens = []
-        threshold_date = datetime.now() + timedelta(days=days_threshold)
+        malformed = 0
+        now = datetime.now()
+        threshold_date = now + timedelta(days=days_threshold)
         
         for token in tokens:
-            if not token.get('expires_at'):
+            value = token.expires_at
+            if not value:
                 continue  # Token doesn't expire
-                
-            try:
-                expires_at = datetime.fromisoformat(token['expires_at'].replace('Z', '+00:00'))
-                # Convert to naive datetime for comparison
-                expires_at = expires_at.replace(tzinfo=None)
-                
-                if expires_at <= threshold_date:
-                    days_until_expiry = (expires_at - datetime.now()).days
-                    token['days_until_expiry'] = days_until_expiry
-                    expiring_tokens.append(token)
-                    
-            except ValueError as e:
-                print(f"Error parsing date for token {token.get('name', 'unknown')}: {e}")
+            
+            # Screen out malformed values up front so the common case never raises
+            expires_at = self._parse_expires_at(value) if _ISO_RE.match(value) else None
+            if expires_at is None:
+                malformed += 1
+                continue
+            
+            if expires_at <= threshold_date:
+                days_until_expiry = (expires_at - now).days
+                token.days_until_expiry = days_until_expiry
+                expiring_tokens.append(token)
+        
+        if malformed:
+            print(f"Skipped {malformed} tokens with an unparseable expiry date")
                 
         return expiring_tokens
     
-    def send_email_notification(self, expiring_tokens: List[Dict]):
-        """Send email notification about expiring tokens"""
+    @staticmethod
+    def _parse_expires_at(value: str) -> Optional[datetime]:
+        """Parse a well-formed expires_at value into a naive datetime, or None if out of range"""
+        # fromisoformat only accepts a 'Z' suffix from Python 3.11 on
+        if value.endswith('Z'):
+            value = value[:-1] + '+00:00'
+        try:
+            return datetime.fromisoformat(value).replace(tzinfo=None)
+        except ValueError:
+            return None  # e.g. month 13, which the format check can't rule out
+    
+    def send_email_notification(self, expiring_tokens: List[Token], smtp_future: Optional[Future] = None):
+        """Send email notification about expiring tokens, reusing a pre-opened connection if given"""
         if not expiring_tokens:
             return
             
-        # Group tokens by type
-        personal_tokens = [t for t in expiring_tokens if t.get('user_id') and not t.get('token_type')]
-        project_tokens = [t for t in expiring_tokens if t.get('token_type') == 'project']
-        group_tokens = [t for t in expiring_tokens if t.get('token_type') == 'group']
+        # Group tokens by type in a single pass
+        personal_tokens, project_tokens, group_tokens = [], [], []
+        for token in expiring_tokens:
+            token_type = token.token_type
+            if token_type == 'project':
+                project_tokens.append(token)
+            elif token_type == 'group':
+                group_tokens.append(token)
+            elif not token_type and token.user_id:
+                personal_tokens.append(token)
         
         # Create email content
         subject = f"GitLab Token Expiration Alert - {len(expiring_tokens)} tokens expiring"
         
-        body = self._create_email_body(personal_tokens, project_tokens, group_tokens)
+        # Resolve every distinct owner up front so rendering never waits on a round-trip per row
+        users_map = self.get_users_bulk({t.user_id for t in personal_tokens if t.user_id})
+        groups_map = self.get_groups_bulk({t.group_id for t in group_tokens if t.group_id})
+        body = self._create_email_body(personal_tokens, project_tokens, group_tokens, users_map, groups_map)
         
         # Send email
         try:
@@ -197,16 +443,7 @@ class GitLabTokenMonitor:
             
             msg.attach(MIMEText(body, 'html'))
             
-            if self.smtp_config.get('use_ssl', True):
-                server = smtplib.SMTP_SSL(self.smtp_config['smtp_server'], self.smtp_config['smtp_port'])
-            else:
-                server = smtplib.SMTP(self.smtp_config['smtp_server'], self.smtp_config['smtp_port'])
-                if self.smtp_config.get('use_tls'):
-                    server.starttls()
-            
-            if self.smtp_config.get('username'):
-                server.login(self.smtp_config['username'], self.smtp_config['password'])
-                
+            server = self._take_smtp_connection(smtp_future)
             server.send_message(msg)
             server.quit()
             
@@ -215,9 +452,63 @@ class GitLabTokenMonitor:
         except Exception as e:
             print(f"Error sending email: {e}")
     
-    def _create_email_body(self, personal_tokens: List[Dict], project_tokens: List[Dict], group_tokens: List[Dict]) -> str:
+    def _connect_smtp(self) -> smtplib.SMTP:
+        """Open and authenticate an SMTP connection"""
+        if self.smtp_config.get('use_ssl', True):
+            server = smtplib.SMTP_SSL(self.smtp_config['smtp_server'], self.smtp_config['smtp_port'],
+                                      timeout=_SMTP_TIMEOUT)
+        else:
+            server = smtplib.SMTP(self.smtp_config['smtp_server'], self.smtp_config['smtp_port'],
+                                  timeout=_SMTP_TIMEOUT)
+            if self.smtp_config.get('use_tls'):
+                server.starttls()
+        
+        if self.smtp_config.get('username'):
+            server.login(self.smtp_config['username'], self.smtp_config['password'])
+        return server
+    
+    def _preconnect_smtp(self) -> Future:
+        """Start opening the SMTP connection in the background while GitLab is queried"""
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(self._connect_smtp)
+        executor.shutdown(wait=False)
+        return future
+    
+    def _take_smtp_connection(self, smtp_future: Optional[Future]) -> smtplib.SMTP:
+        """Return the pre-opened SMTP connection, reconnecting if it failed or timed out idle"""
+        # The pre-connect is speculative: whatever it failed with, connect again now
+        if smtp_future is not None:
+            try:
+                server = smtp_future.result()
+            except Exception:
+                return self._connect_smtp()
+            try:
+                server.noop()
+                return server
+            except Exception:
+                server.close()
+        return self._connect_smtp()
+    
+    @staticmethod
+    def _discard_smtp_connection(smtp_future: Future):
+        """Quietly close a pre-opened SMTP connection that is no longer needed"""
+        # Runs in a finally block, so no pre-connect failure may escape and mask
+        # the scan's own outcome
+        try:
+            server = smtp_future.result()
+        except Exception:
+            return
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+    
+    def _create_email_body(self, personal_tokens: List[Token], project_tokens: List[Token], group_tokens: List[Token],
+                           users_map: Dict[int, Dict], groups_map: Dict[int, Dict]) -> str:
         """Create HTML email body"""
-        html = """
+        # Rows are collected in a list and joined once; token names and other
+        # user-controlled fields are escaped before they reach the HTML
+        parts = ["""
         <html>
         <head>
             <style>
@@ -231,11 +522,11 @@ class GitLabTokenMonitor:
         <body>
             <h2>GitLab Token Expiration Alert</h2>
             <p>The following tokens are expiring soon or have already expired:</p>
-        """
+        """]
         
         if personal_tokens:
-            html += "<h3>Personal Access Tokens</h3>"
-            html += """
+            parts.append("<h3>Personal Access Tokens</h3>")
+            parts.append("""
             <table>
                 <tr>
                     <th>Token Name</th>
@@ -245,31 +536,31 @@ class GitLabTokenMonitor:
                     <th>Days Until Expiry</th>
                     <th>Scopes</th>
                 </tr>
-            """
+            """)
             
             for token in personal_tokens:
-                user_info = self.get_user_info(token['user_id']) if token.get('user_id') else {}
-                username = user_info.get('username', 'Unknown') if user_info else 'Unknown'
-                email = user_info.get('email', 'Unknown') if user_info else 'Unknown'
+                user_info = users_map.get(token.user_id, {})
+                username = user_info.get('username', 'Unknown')
+                email = user_info.get('email', 'Unknown')
                 
-                status_class = 'expired' if token['days_until_expiry'] < 0 else 'warning'
+                status_class = 'expired' if token.days_until_expiry < 0 else 'warning'
                 
-                html += f"""
+                parts.append(f"""
                 <tr>
-                    <td>{token.get('name', 'Unnamed')}</td>
-                    <td>{username}</td>
-                    <td>{email}</td>
-                    <td>{token.get('expires_at', 'Unknown')}</td>
-                    <td class="{status_class}">{token['days_until_expiry']}</td>
-                    <td>{', '.join(token.get('scopes', []))}</td>
+                    <td>{escape(token.name or 'Unnamed')}</td>
+                    <td>{escape(str(username))}</td>
+                    <td>{escape(str(email))}</td>
+                    <td>{escape(token.expires_at)}</td>
+                    <td class="{status_class}">{token.days_until_expiry}</td>
+                    <td>{escape(', '.join(token.scopes))}</td>
                 </tr>
-                """
+                """)
             
-            html += "</table>"
+            parts.append("</table>")
         
         if group_tokens:
-            html += "<h3>Group Access Tokens</h3>"
-            html += """
+            parts.append("<h3>Group Access Tokens</h3>")
+            parts.append("""
             <table>
                 <tr>
                     <th>Token Name</th>
@@ -280,32 +571,32 @@ class GitLabTokenMonitor:
                     <th>Access Level</th>
                     <th>Scopes</th>
                 </tr>
-            """
+            """)
             
             for token in group_tokens:
-                group_info = self.get_group_info(token['group_id']) if token.get('group_id') else {}
-                group_name = group_info.get('name', 'Unknown') if group_info else 'Unknown'
-                group_path = group_info.get('full_path', 'Unknown') if group_info else 'Unknown'
+                group_info = groups_map.get(token.group_id, {})
+                group_name = group_info.get('name', 'Unknown')
+                group_path = group_info.get('full_path', 'Unknown')
                 
-                status_class = 'expired' if token['days_until_expiry'] < 0 else 'warning'
+                status_class = 'expired' if token.days_until_expiry < 0 else 'warning'
                 
-                html += f"""
+                parts.append(f"""
                 <tr>
-                    <td>{token.get('name', 'Unnamed')}</td>
-                    <td>{group_name}</td>
-                    <td>{group_path}</td>
-                    <td>{token.get('expires_at', 'Unknown')}</td>
-                    <td class="{status_class}">{token['days_until_expiry']}</td>
-                    <td>{token.get('access_level', 'Unknown')}</td>
-                    <td>{', '.join(token.get('scopes', []))}</td>
+                    <td>{escape(token.name or 'Unnamed')}</td>
+                    <td>{escape(str(group_name))}</td>
+                    <td>{escape(str(group_path))}</td>
+                    <td>{escape(token.expires_at)}</td>
+                    <td class="{status_class}">{token.days_until_expiry}</td>
+                    <td>{escape(str(token.access_level or 'Unknown'))}</td>
+                    <td>{escape(', '.join(token.scopes))}</td>
                 </tr>
-                """
+                """)
             
-            html += "</table>"
+            parts.append("</table>")
         
         if project_tokens:
-            html += "<h3>Project Access Tokens</h3>"
-            html += """
+            parts.append("<h3>Project Access Tokens</h3>")
+            parts.append("""
             <table>
                 <tr>
                     <th>Token Name</th>
@@ -314,24 +605,24 @@ class GitLabTokenMonitor:
                     <th>Days Until Expiry</th>
                     <th>Access Level</th>
                 </tr>
-            """
+            """)
             
             for token in project_tokens:
-                status_class = 'expired' if token['days_until_expiry'] < 0 else 'warning'
+                status_class = 'expired' if token.days_until_expiry < 0 else 'warning'
                 
-                html += f"""
+                parts.append(f"""
                 <tr>
-                    <td>{token.get('name', 'Unnamed')}</td>
-                    <td>{token.get('project_id', 'Unknown')}</td>
-                    <td>{token.get('expires_at', 'Unknown')}</td>
-                    <td class="{status_class}">{token['days_until_expiry']}</td>
-                    <td>{token.get('access_level', 'Unknown')}</td>
+                    <td>{escape(token.name or 'Unnamed')}</td>
+                    <td>{token.project_id}</td>
+                    <td>{escape(token.expires_at)}</td>
+                    <td class="{status_class}">{token.days_until_expiry}</td>
+                    <td>{escape(str(token.access_level or 'Unknown'))}</td>
                 </tr>
-                """
+                """)
             
-            html += "</table>"
+            parts.append("</table>")
         
-        html += """
+        parts.append("""
             <p><strong>Action Required:</strong> Please review and renew these tokens before they expire to avoid service interruptions.</p>
             <p>You can manage your tokens in GitLab at:</p>
             <ul>
@@ -340,70 +631,89 @@ class GitLabTokenMonitor:
             </ul>
         </body>
         </html>
-        """.format(self.gitlab_url)
+        """.format(escape(self.gitlab_url)))
         
-        return html
+        return "".join(parts)
     
     def run_monitoring(self, days_threshold: int = 7, include_project_tokens: bool = True, include_group_tokens: bool = True):
         """Run the complete monitoring process"""
         print(f"Starting GitLab token expiration monitoring...")
         print(f"Checking for tokens expiring within {days_threshold} days")
         
-        all_expiring_tokens = []
-        
-        # Check personal access tokens
-        print("Fetching personal access tokens...")
-        personal_tokens = self.get_personal_access_tokens()
-        expiring_personal = self.check_token_expiration(personal_tokens, days_threshold)
-        all_expiring_tokens.extend(expiring_personal)
-        
-        print(f"Found {len(expiring_personal)} expiring personal access tokens")
+        # The SMTP handshake runs against a different host, so overlap it with the GitLab fetches
+        smtp_future = self._preconnect_smtp()
         
-        # Check project access tokens
-        if include_project_tokens:
-            print("Fetching project access tokens...")
-            projects = self.get_all_projects()
+        # Close the pre-opened SMTP connection and the HTTP session even if the scan fails
+        try:
+            all_expiring_tokens = []
+            
+            # Check personal access tokens
+            print("Fetching personal access tokens...")
+            # Let GitLab drop tokens beyond the threshold; expires_before is exclusive,
+            # so ask for one extra day and leave the exact cut-off to check_token_expiration
+            expires_before = (datetime.now() + timedelta(days=days_threshold + 1)).date().isoformat()
+            personal_tokens = self.get_personal_access_tokens(expires_before)
+            expiring_personal = self.check_token_expiration(personal_tokens, days_threshold)
+            all_expiring_tokens.extend(expiring_personal)
+            
+            print(f"Found {len(expiring_personal)} expiring personal access tokens")
             
-            for project in projects:
-                project_tokens = self.get_project_access_tokens(project['id'])
-                expiring_project = self.check_token_expiration(project_tokens, days_threshold)
+            # Check project access tokens
+            if include_project_tokens:
+                print("Fetching project access tokens...")
+                # Token fetches are submitted as each page of projects arrives; archived
+                # projects are skipped in case the server ignores the archived filter
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    futures = {executor.submit(self.get_project_access_tokens, project['id']): project
+                               for project in self.iter_all_projects() if not project.get('archived')}
                 
-                # Add project info to tokens
-                for token in expiring_project:
-                    token['project_name'] = project['name']
-                    token['project_path'] = project.get('path_with_namespace', project['name'])
+                for future, project in futures.items():
+                    project_tokens = future.result()
+                    expiring_project = self.check_token_expiration(project_tokens, days_threshold)
+                    
+                    # Add project info to tokens
+                    for token in expiring_project:
+                        token.project_name = project['name']
+                        token.project_path = project.get('path_with_namespace', project['name'])
+                    
+                    all_expiring_tokens.extend(expiring_project)
                 
-                all_expiring_tokens.extend(expiring_project)
-            
-            project_token_count = len([t for t in all_expiring_tokens if t.get('token_type') == 'project'])
-            print(f"Found {project_token_count} expiring project access tokens")
-        
-        # Check group access tokens
-        if include_group_tokens:
-            print("Fetching group access tokens...")
-            groups = self.get_all_groups()
+                project_token_count = len([t for t in all_expiring_tokens if t.token_type == 'project'])
+                print(f"Found {project_token_count} expiring project access tokens")
             
-            for group in groups:
-                group_tokens = self.get_group_access_tokens(group['id'])
-                expiring_group = self.check_token_expiration(group_tokens, days_threshold)
+            # Check group access tokens
+            if include_group_tokens:
+                print("Fetching group access tokens...")
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    futures = {executor.submit(self.get_group_access_tokens, group['id']): group
+                               for group in self.iter_all_groups()}
                 
-                # Add group info to tokens
-                for token in expiring_group:
-                    token['group_name'] = group['name']
-                    token['group_path'] = group.get('full_path', group['name'])
+                for future, group in futures.items():
+                    group_tokens = future.result()
+                    expiring_group = self.check_token_expiration(group_tokens, days_threshold)
+                    
+                    # Add group info to tokens
+                    for token in expiring_group:
+                        token.group_name = group['name']
+                        token.group_path = group.get('full_path', group['name'])
+                    
+                    all_expiring_tokens.extend(expiring_group)
                 
-                all_expiring_tokens.extend(expiring_group)
+                group_token_count = len([t for t in all_expiring_tokens if t.token_type == 'group'])
+                print(f"Found {group_token_count} expiring group access tokens")
             
-            group_token_count = len([t for t in all_expiring_tokens if t.get('token_type') == 'group'])
-            print(f"Found {group_token_count} expiring group access tokens")
-        
-        # Send notifications
-        if all_expiring_tokens:
-            print(f"Total expiring tokens: {len(all_expiring_tokens)}")
-            self.send_email_notification(all_expiring_tokens)
-        else:
-            print("No expiring tokens found")
-        
+            # Send notifications
+            if all_expiring_tokens:
+                print(f"Total expiring tokens: {len(all_expiring_tokens)}")
+                self.send_email_notification(all_expiring_tokens, smtp_future)
+                # The notification now owns the pre-opened connection
+                smtp_future = None
+            else:
+                print("No expiring tokens found")
+        finally:
+            if smtp_future is not None:
+                self._discard_smtp_connection(smtp_future)
+            self.close()
         print("Monitoring complete!")
 
 
@@ -424,7 +734,11 @@ def main():
         },
         'days_threshold': int(os.getenv('DAYS_THRESHOLD', '7')),
         'include_project_tokens': os.getenv('INCLUDE_PROJECT_TOKENS', 'true').lower() == 'true',
-        'include_group_tokens': os.getenv('INCLUDE_GROUP_TOKENS', 'true').lower() == 'true'
+        'include_group_tokens': os.getenv('INCLUDE_GROUP_TOKENS', 'true').lower() == 'true',
+        'max_workers': int(os.getenv('MAX_WORKERS', '20')),
+        'cache_path': os.getenv('CACHE_PATH', '.cache/gitlab_token_monitor.sqlite'),
+        'cache_ttl_hours': int(os.getenv('CACHE_TTL_HOURS', '24')),
+        'http2': os.getenv('GITLAB_HTTP2', 'false').lower() == 'true'
     }
     
     # Validate required config
@@ -436,11 +750,22 @@ def main():
         print("Error: FROM_EMAIL environment variable is required")
         sys.exit(1)
     
+    # User/group details rarely change, so reuse them across scheduled runs
+    cache = None
+    if config['cache_path'] and MetadataCache is not None:
+        try:
+            cache = MetadataCache(config['cache_path'], config['cache_ttl_hours'] * 3600)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Warning: cannot open cache at {config['cache_path']} ({e}), continuing without it")
+    
     # Initialize and run monitor
     monitor = GitLabTokenMonitor(
         config['gitlab_url'],
         config['admin_token'],
-        config['smtp_config']
+        config['smtp_config'],
+        config['max_workers'],
+        cache,
+        config['http2']
     )
     
     monitor.run_monitoring(
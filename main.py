@@ -4,18 +4,41 @@ GitLab Token Expiration Monitor - Main Application
 Orchestrates the complete token monitoring process
 """
 
-from config import Config
+import logging
+import os
+import sqlite3
+from collections import Counter
+
+from config import get_config
 from gitlab_api import GitLabAPI
+from metadata_cache import MetadataCache
 from token_analyzer import TokenAnalyzer
 from email_reporter import EmailReporter
 
 class GitLabTokenMonitor:
     def __init__(self):
-        self.config = Config()
-        self.gitlab_api = GitLabAPI(self.config.gitlab_url, self.config.get_headers())
+        self.config = get_config()
+        self.cache = self._open_cache()
+        self.gitlab_api = GitLabAPI(self.config.gitlab_url, self.config.get_headers(), self.config.max_workers,
+                                    self.cache, self.config.http2)
         self.email_reporter = EmailReporter(self.config.smtp_config, self.config.gitlab_url, self.gitlab_api)
         self.analyzer = TokenAnalyzer()
     
+    def _open_cache(self):
+        """Open the on-disk cache, running without it if it cannot be created"""
+        if not self.config.cache_path:
+            return None
+        try:
+            return MetadataCache(self.config.cache_path, self.config.cache_ttl_hours * 3600)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Warning: cannot open cache at {self.config.cache_path} ({e}), continuing without it")
+            return None
+    
+    def close(self):
+        """Close the on-disk cache"""
+        if self.cache is not None:
+            self.cache.close()
+    
     def run_monitoring(self):
         """Run the complete monitoring process"""
         print(f"Starting GitLab token expiration monitoring...")
@@ -71,60 +94,83 @@ class GitLabTokenMonitor:
             all_analysis[category].extend(new_analysis[category])
         all_analysis['total_count'] += new_analysis['total_count']
     
+    @staticmethod
+    def _collect_ids(resources, seen: dict):
+        """Yield each active resource's ID, recording the resource in `seen` by ID"""
+        for resource in resources:
+            if resource.get('archived'):
+                continue
+            seen[resource['id']] = resource
+            yield resource['id']
+    
     def _process_project_tokens(self, all_token_analysis: dict) -> dict:
         """Process all project tokens and return statistics"""
         print("Fetching project access tokens...")
-        projects = self.gitlab_api.get_all_projects()
+        # Token fetches start as soon as each page of projects arrives
+        projects = {}
+        tokens_by_project = self.gitlab_api.get_all_project_access_tokens(
+            self._collect_ids(self.gitlab_api.iter_all_projects(), projects)
+        )
         
         project_total = 0
-        for project in projects:
-            project_tokens = self.gitlab_api.get_project_access_tokens(project['id'])
+        # Count per category while merging instead of rescanning the merged lists
+        project_counts = Counter()
+        for project_id, project_tokens in tokens_by_project.items():
+            project = projects[project_id]
             if project_tokens:
                 project_analysis = self.analyzer.analyze_all_tokens(project_tokens, self.config.days_threshold)
                 
                 # Add project info to tokens
                 for category in ['expired', 'expiring_soon', 'healthy', 'no_expiration']:
+                    project_counts[category] += len(project_analysis[category])
                     for token in project_analysis[category]:
-                        token['project_name'] = project['name']
-                        token['project_path'] = project.get('path_with_namespace', project['name'])
+                        token.project_name = project['name']
+                        token.project_path = project.get('path_with_namespace', project['name'])
                 
                 self._merge_analysis(all_token_analysis, project_analysis)
                 project_total += project_analysis['total_count']
         
         return {
             'total': project_total,
-            'expired': len([t for t in all_token_analysis['expired'] if t.get('token_type') == 'project']),
-            'expiring': len([t for t in all_token_analysis['expiring_soon'] if t.get('token_type') == 'project']),
-            'healthy': len([t for t in all_token_analysis['healthy'] if t.get('token_type') == 'project']),
-            'permanent': len([t for t in all_token_analysis['no_expiration'] if t.get('token_type') == 'project'])
+            'expired': project_counts['expired'],
+            'expiring': project_counts['expiring_soon'],
+            'healthy': project_counts['healthy'],
+            'permanent': project_counts['no_expiration']
         }
     
     def _process_group_tokens(self, all_token_analysis: dict) -> dict:
         """Process all group tokens and return statistics"""
         print("Fetching group access tokens...")
-        groups = self.gitlab_api.get_all_groups()
+        # Token fetches start as soon as each page of groups arrives
+        groups = {}
+        tokens_by_group = self.gitlab_api.get_all_group_access_tokens(
+            self._collect_ids(self.gitlab_api.iter_all_groups(), groups)
+        )
         
         group_total = 0
-        for group in groups:
-            group_tokens = self.gitlab_api.get_group_access_tokens(group['id'])
+        # Count per category while merging instead of rescanning the merged lists
+        group_counts = Counter()
+        for group_id, group_tokens in tokens_by_group.items():
+            group = groups[group_id]
             if group_tokens:
                 group_analysis = self.analyzer.analyze_all_tokens(group_tokens, self.config.days_threshold)
                 
                 # Add group info to tokens
                 for category in ['expired', 'expiring_soon', 'healthy', 'no_expiration']:
+                    group_counts[category] += len(group_analysis[category])
                     for token in group_analysis[category]:
-                        token['group_name'] = group['name']
-                        token['group_path'] = group.get('full_path', group['name'])
+                        token.group_name = group['name']
+                        token.group_path = group.get('full_path', group['name'])
                 
                 self._merge_analysis(all_token_analysis, group_analysis)
                 group_total += group_analysis['total_count']
         
         return {
             'total': group_total,
-            'expired': len([t for t in all_token_analysis['expired'] if t.get('token_type') == 'group']),
-            'expiring': len([t for t in all_token_analysis['expiring_soon'] if t.get('token_type') == 'group']),
-            'healthy': len([t for t in all_token_analysis['healthy'] if t.get('token_type') == 'group']),
-            'permanent': len([t for t in all_token_analysis['no_expiration'] if t.get('token_type') == 'group'])
+            'expired': group_counts['expired'],
+            'expiring': group_counts['expiring_soon'],
+            'healthy': group_counts['healthy'],
+            'permanent': group_counts['no_expiration']
         }
     
     def _print_summary_and_notify(self, all_token_analysis: dict):
@@ -142,7 +188,7 @@ class GitLabTokenMonitor:
         if self.config.send_all_tokens or stats['problematic_count'] > 0:
             all_token_analysis['include_all_tokens'] = self.config.send_all_tokens
             print(f"\nSending email report...")
-            self.email_reporter.send_notification(all_token_analysis)
+            self.email_reporter.send_notification(all_token_analysis, stats)
         else:
             print("\nNo problematic tokens found, skipping email notification")
             print("Use SEND_ALL_TOKENS=true to receive reports even when all tokens are healthy")
@@ -151,6 +197,10 @@ class GitLabTokenMonitor:
 
 def main():
     """Main entry point"""
+    logging.basicConfig(
+        level=os.getenv('LOG_LEVEL', 'WARNING').upper(),
+        format='%(levelname)s %(name)s: %(message)s'
+    )
     print("GitLab Token Monitor Starting...")
     
     try:
@@ -159,7 +209,10 @@ def main():
         print("Configuration loaded successfully!")
         
         print("Starting monitoring process...")
-        monitor.run_monitoring()
+        try:
+            monitor.run_monitoring()
+        finally:
+            monitor.close()
         
     except KeyboardInterrupt:
         print("\nMonitoring interrupted by user")
@@ -168,8 +221,10 @@ def main():
         print("Make sure all required files are in the same directory:")
         print("- config.py")
         print("- gitlab_api.py") 
+        print("- token_model.py")
         print("- token_analyzer.py")
         print("- email_reporter.py")
+        print("- metadata_cache.py")
     except Exception as e:
         print(f"Error during monitoring: {e}")
         import traceback
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Metadata Cache
+Persists GitLab user/group lookups and conditional-request validators
+between runs in a local SQLite file
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import orjson
+from typing import Dict, Optional, Tuple
+
+class MetadataCache:
+    def __init__(self, path: str, ttl_seconds: int = 24 * 3600):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.ttl_seconds = ttl_seconds
+        # Lookups run on the API worker threads, so they share one connection behind a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS metadata '
+                '(key TEXT PRIMARY KEY, body BLOB NOT NULL, fetched_at INTEGER NOT NULL)'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses '
+                '(url TEXT PRIMARY KEY, etag TEXT NOT NULL, body BLOB NOT NULL, headers BLOB)'
+            )
+            # Cache files written before response headers were stored lack the column
+            columns = {row[1] for row in self._conn.execute('PRAGMA table_info(responses)')}
+            if 'headers' not in columns:
+                self._conn.execute('ALTER TABLE responses ADD COLUMN headers BLOB')
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Get a cached entry, or None if it is missing or older than the TTL"""
+        with self._lock:
+            row = self._conn.execute('SELECT body, fetched_at FROM metadata WHERE key = ?', (key,)).fetchone()
+
+        if row is None or time.time() - row[1] > self.ttl_seconds:
+            return None
+        return orjson.loads(row[0])
+
+    def set(self, key: str, value: Dict):
+        """Store an entry, stamping it with the current time"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO metadata (key, body, fetched_at) VALUES (?, ?, ?)',
+                (key, orjson.dumps(value), int(time.time()))
+            )
+
+    def delete(self, key: str):
+        """Drop an entry, e.g. when the user or group it describes no longer exists"""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM metadata WHERE key = ?', (key,))
+
+    def get_response(self, url: str) -> Optional[Tuple[str, bytes, Optional[Dict[str, str]]]]:
+        """Get the last seen ETag, raw body and stored response headers (None if not stored) for a URL"""
+        # No TTL here: the server revalidates the ETag on every request
+        with self._lock:
+            row = self._conn.execute('SELECT etag, body, headers FROM responses WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], orjson.loads(row[2]) if row[2] is not None else None
+
+    def set_response(self, url: str, etag: str, body: bytes, headers: Optional[Dict[str, str]] = None):
+        """Store the ETag, raw body and selected response headers of a successful response"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (url, etag, body, headers) VALUES (?, ?, ?, ?)',
+                (url, etag, body, orjson.dumps(headers) if headers is not None else None)
+            )
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
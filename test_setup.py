@@ -5,46 +5,57 @@ Test script to verify GitLab Token Monitor setup
 
 import os
 import sys
+from importlib.util import find_spec
+from typing import List, Tuple
 
-def test_imports():
+# Example values from env.example that mean a variable was never configured
+_PLACEHOLDERS = frozenset({'your-admin-token', 'alerts@yourcompany.com', 'https://your-gitlab.com'})
+
+def _emit(lines: List[str]):
+    """Write a block of report lines to stdout in one call"""
+    sys.stdout.write('\n'.join(lines) + '\n')
+
+def test_imports() -> Tuple[bool, List[str]]:
     """Test if all required modules can be imported"""
-    print("🔍 Testing imports...")
+    out = ["🔍 Testing imports..."]
     
     try:
         import requests
-        print("✅ requests module available")
+        out.append("✅ requests module available")
     except ImportError:
-        print("❌ requests module missing - run: pip install requests")
-        return False
+        out.append("❌ requests module missing - run: pip install requests")
+        return False, out
     
-    required_files = ['config.py', 'gitlab_api.py', 'token_analyzer.py', 'email_reporter.py']
+    required_modules = ['config', 'gitlab_api', 'token_model', 'token_analyzer', 'email_reporter', 'metadata_cache']
     
-    for file in required_files:
-        if os.path.exists(file):
-            print(f"✅ {file} found")
+    # Resolve through sys.path (the script's directory first), so the check
+    # works from any working directory
+    for module in required_modules:
+        if find_spec(module) is not None:
+            out.append(f"✅ {module}.py found")
         else:
-            print(f"❌ {file} missing")
-            return False
+            out.append(f"❌ {module}.py missing")
+            return False, out
     
     try:
         from config import Config
-        print("✅ config module can be imported")
+        out.append("✅ config module can be imported")
     except ImportError as e:
-        print(f"❌ Cannot import config: {e}")
-        return False
+        out.append(f"❌ Cannot import config: {e}")
+        return False, out
         
     try:
         from gitlab_api import GitLabAPI
-        print("✅ gitlab_api module can be imported")
+        out.append("✅ gitlab_api module can be imported")
     except ImportError as e:
-        print(f"❌ Cannot import gitlab_api: {e}")
-        return False
+        out.append(f"❌ Cannot import gitlab_api: {e}")
+        return False, out
         
-    return True
+    return True, out
 
-def test_environment():
+def test_environment() -> Tuple[bool, List[str]]:
     """Test environment variables"""
-    print("\n🔍 Testing environment variables...")
+    out = ["\n🔍 Testing environment variables..."]
     
     required_vars = {
         'GITLAB_URL': 'GitLab instance URL',
@@ -60,45 +71,48 @@ def test_environment():
     }
     
     all_good = True
+    env = os.environ
     
     for var, description in required_vars.items():
-        value = os.getenv(var)
-        if value and value not in ['your-admin-token', 'alerts@yourcompany.com', 'https://your-gitlab.com']:
-            print(f"✅ {var}: {description} is set")
+        value = env.get(var)
+        if value and value not in _PLACEHOLDERS:
+            out.append(f"✅ {var}: {description} is set")
         else:
-            print(f"❌ {var}: {description} is NOT SET")
-            print(f"   Set with: export {var}='your-value'")
+            out.append(f"❌ {var}: {description} is NOT SET")
+            out.append(f"   Set with: export {var}='your-value'")
             all_good = False
     
-    print(f"\n📋 Optional variables:")
+    out.append(f"\n📋 Optional variables:")
     for var, description in optional_vars.items():
-        value = os.getenv(var)
+        value = env.get(var)
         if value:
-            print(f"✅ {var}: {description} is set")
+            out.append(f"✅ {var}: {description} is set")
         else:
-            print(f"⚠️  {var}: {description} is not set (will use defaults)")
+            out.append(f"⚠️  {var}: {description} is not set (will use defaults)")
     
-    return all_good
+    return all_good, out
 
-def test_config_loading():
+def test_config_loading() -> Tuple[bool, List[str]]:
     """Test config loading"""
-    print("\n🔍 Testing config loading...")
+    out = ["\n🔍 Testing config loading..."]
     
     try:
         from config import Config
         config = Config()
-        print("✅ Config loaded successfully")
-        return True
+        out.append("✅ Config loaded successfully")
+        return True, out
     except SystemExit:
-        print("❌ Config validation failed - check environment variables above")
-        return False
+        out.append("❌ Config validation failed - check environment variables above")
+        return False, out
     except Exception as e:
-        print(f"❌ Config loading failed: {e}")
-        return False
+        out.append(f"❌ Config loading failed: {e}")
+        return False, out
 
 def main():
     """Run all tests"""
-    print("🧪 GitLab Token Monitor Setup Test\n")
+    # Each test returns its report lines and they are written in one call at the end,
+    # instead of one locked, line-flushed print() per line
+    out = ["🧪 GitLab Token Monitor Setup Test\n"]
     
     tests = [
         ("Import Test", test_imports),
@@ -109,27 +123,29 @@ def main():
     results = []
     for test_name, test_func in tests:
         try:
-            result = test_func()
+            result, lines = test_func()
+            out.extend(lines)
             results.append(result)
         except Exception as e:
-            print(f"❌ {test_name} failed with error: {e}")
+            out.append(f"❌ {test_name} failed with error: {e}")
             results.append(False)
-        print()
+        out.append("")
     
-    print("📊 Test Summary:")
-    print("=" * 50)
+    out.append("📊 Test Summary:")
+    out.append("=" * 50)
     
     for i, (test_name, _) in enumerate(tests):
         status = "✅ PASS" if results[i] else "❌ FAIL"
-        print(f"{test_name}: {status}")
+        out.append(f"{test_name}: {status}")
     
     if all(results):
-        print(f"\n🎉 All tests passed! You can run: python main.py")
+        out.append(f"\n🎉 All tests passed! You can run: python main.py")
     else:
-        print(f"\n🚨 Some tests failed. Fix the issues above before running main.py")
+        out.append(f"\n🚨 Some tests failed. Fix the issues above before running main.py")
+    _emit(out)
         
     return all(results)
 
 if __name__ == "__main__":
     success = main()
-    sys.exit(0 if success else 1)
\ No newline at end of file
+    sys.exit(0 if success else 1)
@@ -4,12 +4,31 @@ Token Analyzer
 Handles token expiration analysis and categorization
 """
 
-from datetime import datetime, timedelta
+import re
+from datetime import datetime, timezone
+from functools import lru_cache
 from typing import List, Dict
+from token_model import Token
+
+SECONDS_PER_DAY = 86400
+# GitLab's expires_at values: a plain date, or a timestamp with an optional offset
+_ISO_RE = re.compile(r'\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)?$')
+_BUCKET_STATUSES = ('Expired', 'Expiring Soon', 'Healthy')
+
+# Expiry dates repeat across the analyze_all_tokens calls made for each project
+# and group in one run, and the parsed datetimes are immutable, so they are safe to share
+@lru_cache(maxsize=4096)
+def _parse_expires(value: str) -> datetime:
+    """Parse an expires_at value into a datetime, keeping its wall-clock time"""
+    # GitLab token expiry is almost always a bare YYYY-MM-DD date, which is
+    # cheaper to build directly than to run through fromisoformat
+    if len(value) == 10 and value[4] == '-' and value[7] == '-':
+        return datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+    return datetime.fromisoformat(value.removesuffix('Z'))
 
 class TokenAnalyzer:
     @staticmethod
-    def analyze_all_tokens(tokens: List[Dict], days_threshold: int = 7) -> Dict:
+    def analyze_all_tokens(tokens: List[Token], days_threshold: int = 7) -> Dict:
         """Analyze all tokens and categorize them by expiration status"""
         result = {
             'expiring_soon': [],
@@ -19,63 +38,84 @@ class TokenAnalyzer:
             'total_count': len(tokens)
         }
         
-        threshold_date = datetime.now() + timedelta(days=days_threshold)
-        current_date = datetime.now()
+        # Compare plain float timestamps in the loop instead of datetimes and timedeltas;
+        # wall-clock times are pinned to UTC so the arithmetic matches naive datetimes
+        now_ts = datetime.now().replace(tzinfo=timezone.utc).timestamp()
+        # Never before now, so the bucket index below stays ordered
+        threshold_ts = max(now_ts + days_threshold * SECONDS_PER_DAY, now_ts)
+        
+        # Bucket index: 0 = expired, 1 = expiring within threshold, 2 = healthy
+        buckets = (result['expired'], result['expiring_soon'], result['healthy'])
+        
+        # Tokens created under the same rotation policy share expiry dates, so
+        # parse each distinct expires_at value once rather than once per token;
+        # unparseable values map to None
+        expiry_timestamps = {}
+        for value in {t.expires_at for t in tokens if t.expires_at}:
+            # Reject malformed values up front rather than through fromisoformat raising
+            if not _ISO_RE.match(value):
+                expiry_timestamps[value] = None
+                continue
+            # Well-formed values can still be out of range, e.g. month 13
+            try:
+                expires_at = _parse_expires(value)
+                expiry_timestamps[value] = expires_at.replace(tzinfo=timezone.utc).timestamp()
+            except ValueError:
+                expiry_timestamps[value] = None
         
         for token in tokens:
-            if not token.get('expires_at'):
+            if not token.expires_at:
                 # Token doesn't expire (permanent token)
-                token['status'] = 'No Expiration'
-                token['days_until_expiry'] = 'Never'
+                token.status = 'No Expiration'
+                token.days_until_expiry = None
                 result['no_expiration'].append(token)
                 continue
-                
-            try:
-                expires_at = datetime.fromisoformat(token['expires_at'].replace('Z', '+00:00'))
-                # Convert to naive datetime for comparison
-                expires_at = expires_at.replace(tzinfo=None)
-                
-                days_until_expiry = (expires_at - current_date).days
-                token['days_until_expiry'] = days_until_expiry
-                
-                if expires_at <= current_date:
-                    # Already expired
-                    token['status'] = 'Expired'
-                    result['expired'].append(token)
-                elif expires_at <= threshold_date:
-                    # Expiring within threshold
-                    token['status'] = 'Expiring Soon'
-                    result['expiring_soon'].append(token)
-                else:
-                    # Healthy (expires beyond threshold)
-                    token['status'] = 'Healthy'
-                    result['healthy'].append(token)
-                    
-            except ValueError as e:
-                print(f"Error parsing date for token {token.get('name', 'unknown')}: {e}")
-                token['status'] = 'Error'
-                token['days_until_expiry'] = 'Unknown'
+            
+            expires_ts = expiry_timestamps[token.expires_at]
+            if expires_ts is None:
+                print(f"Error parsing date for token {token.name or 'unknown'}: "
+                      f"invalid expires_at {token.expires_at!r}")
+                token.status = 'Error'
+                token.days_until_expiry = None
                 result['healthy'].append(token)  # Put error tokens in healthy for safety
+                continue
+            
+            token.days_until_expiry = int((expires_ts - now_ts) // SECONDS_PER_DAY)
+            
+            # Count the boundaries passed instead of walking an if/elif chain
+            bucket = (expires_ts > now_ts) + (expires_ts > threshold_ts)
+            token.status = _BUCKET_STATUSES[bucket]
+            buckets[bucket].append(token)
                 
         return result
     
     @staticmethod
-    def group_tokens_by_type(tokens: List[Dict]) -> Dict[str, List[Dict]]:
+    def group_tokens_by_type(tokens: List[Token]) -> Dict[str, List[Token]]:
         """Group tokens by their type (personal, project, group)"""
-        return {
-            'personal': [t for t in tokens if t.get('user_id') and not t.get('token_type')],
-            'project': [t for t in tokens if t.get('token_type') == 'project'],
-            'group': [t for t in tokens if t.get('token_type') == 'group']
-        }
+        if not tokens:
+            return {'personal': [], 'project': [], 'group': []}
+        
+        personal, project, group = [], [], []
+        for token in tokens:
+            token_type = token.token_type
+            if token_type == 'project':
+                project.append(token)
+            elif token_type == 'group':
+                group.append(token)
+            elif not token_type and token.user_id:
+                personal.append(token)
+        return {'personal': personal, 'project': project, 'group': group}
     
     @staticmethod
     def get_summary_stats(token_analysis: Dict) -> Dict[str, int]:
         """Get summary statistics from token analysis"""
+        expired_count = len(token_analysis['expired'])
+        expiring_count = len(token_analysis['expiring_soon'])
         return {
             'total_tokens': token_analysis['total_count'],
-            'expired_count': len(token_analysis['expired']),
-            'expiring_count': len(token_analysis['expiring_soon']),
+            'expired_count': expired_count,
+            'expiring_count': expiring_count,
             'healthy_count': len(token_analysis['healthy']),
             'permanent_count': len(token_analysis['no_expiration']),
-            'problematic_count': len(token_analysis['expired']) + len(token_analysis['expiring_soon'])
+            'problematic_count': expired_count + expiring_count
         }
\ No newline at end of file
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Token Model
+Access token records as read from the GitLab API
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+@dataclass(slots=True)
+class Token:
+    """An access token with the fields the monitor reads, stored without a per-token dict"""
+    id: Optional[int] = None
+    name: Optional[str] = None
+    expires_at: Optional[str] = None
+    scopes: List[str] = field(default_factory=list)
+    access_level: Optional[int] = None
+    user_id: Optional[int] = None
+    # None for personal access tokens, otherwise 'project' or 'group'
+    token_type: Optional[str] = None
+    project_id: Optional[int] = None
+    project_name: Optional[str] = None
+    project_path: Optional[str] = None
+    group_id: Optional[int] = None
+    group_name: Optional[str] = None
+    group_path: Optional[str] = None
+    # Filled in by TokenAnalyzer.analyze_all_tokens
+    status: Optional[str] = None
+    days_until_expiry: Optional[int] = None
+    
+    @classmethod
+    def from_api(cls, raw: Dict, **extra) -> 'Token':
+        """Build a token from a GitLab API record, ignoring fields the monitor doesn't use"""
+        fields = {k: v for k, v in raw.items() if k in cls.__annotations__}
+        # GitLab can return "scopes": null
+        fields['scopes'] = raw.get('scopes') or []
+        return cls(**fields, **extra)
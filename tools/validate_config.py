@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Configuration Validator
+Checks an env file against the variables read by config.py, ahead of runtime
+"""
+
+import os
+import re
+import sys
+from typing import Dict, Set
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Required variables and the placeholder values that mean "not configured"
+REQUIRED_VARS = {
+    'GITLAB_URL': 'https://your-gitlab.com',
+    'GITLAB_ADMIN_TOKEN': 'your-admin-token',
+    'FROM_EMAIL': 'alerts@yourcompany.com'
+}
+
+_ENV_READ_RE = re.compile(r"""(?:os\.getenv|_env_bool)\(\s*['"]([A-Z0-9_]+)['"]""")
+_ENV_LINE_RE = re.compile(r"""^\s*(?:export\s+)?([A-Z0-9_]+)=["']?(.*?)["']?\s*(?:#.*)?$""")
+
+def read_config_vars(config_path: str) -> Set[str]:
+    """Get the names of all environment variables read by config.py"""
+    with open(config_path, encoding='utf-8') as f:
+        return set(_ENV_READ_RE.findall(f.read()))
+
+def read_env_file(env_path: str) -> Dict[str, str]:
+    """Parse `export NAME="value"` / `NAME=value` lines from an env file"""
+    values = {}
+    with open(env_path, encoding='utf-8') as f:
+        for line in f:
+            match = _ENV_LINE_RE.match(line)
+            if match:
+                values[match.group(1)] = match.group(2)
+    return values
+
+def validate(env_path: str, require_values: bool = False) -> bool:
+    """Validate an env file, printing every problem found"""
+    config_vars = read_config_vars(os.path.join(ROOT, 'config.py'))
+    env_values = read_env_file(env_path)
+    ok = True
+
+    for var in sorted(config_vars - env_values.keys()):
+        print(f"❌ {env_path}: {var} is read by config.py but not documented")
+        ok = False
+
+    for var, placeholder in REQUIRED_VARS.items():
+        if var not in env_values:
+            print(f"❌ {env_path}: required variable {var} is missing")
+            ok = False
+        elif require_values and env_values[var] in ('', placeholder):
+            print(f"❌ {env_path}: required variable {var} still has its placeholder value")
+            ok = False
+
+    return ok
+
+def main():
+    """Validate the env files given on the command line (default: env.example)"""
+    args = sys.argv[1:]
+    # Deployment env files must carry real values; the example only documents names
+    require_values = '--require-values' in args
+    paths = [a for a in args if a != '--require-values'] or [os.path.join(ROOT, 'env.example')]
+
+    results = [validate(path, require_values) for path in paths]
+    return all(results)
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)